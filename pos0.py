@@ -3,482 +3,944 @@ from tkinter import ttk, messagebox
 import customtkinter as ctk
 import sqlite3
 import os
+import re
 from PIL import Image, ImageDraw
 from barcode import Code128
 from barcode.writer import ImageWriter
 import csv
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from operator import itemgetter
+import atexit
+import bisect
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
+import time
 import matplotlib.pyplot as plt
+from matplotlib import dates as mdates, font_manager
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import seaborn as sns
 import numpy as np
 
 # Configure logging
+# Records are handed to a queue; a listener thread does the file/console I/O so
+# logging never blocks the Tk loop. POS_LOG_LEVEL=WARNING quiets production tills.
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+log_level = os.environ.get("POS_LOG_LEVEL", "INFO").upper()
+try:
+    logger.setLevel(log_level)
+    log_level_valid = True
+except ValueError:
+    # An unknown level name must not stop the till from starting
+    logger.setLevel(logging.INFO)
+    log_level_valid = False
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 file_handler = logging.FileHandler('pos.log')
 file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+log_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+if not log_level_valid:
+    logger.warning("Unknown POS_LOG_LEVEL %r, logging at INFO", log_level)
 
 # Ensure directories
 for dir in ["receipts", "barcodes", "exports"]:
     os.makedirs(dir, exist_ok=True)
 
+# Background pool for file I/O (barcode rendering) that should not block Tk
+_io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pos-io")
+
+# Dashboard charts render at a low DPI; the embedded canvases are small, and AGG
+# cost grows with pixel count. Raising the crop factor shrinks both figure size
+# and DPI for cheaper periodic redraws.
+CHART_SIZE = (6, 4)
+CHART_DPI = 72
+CHART_CROP_FACTOR = 1
+# Rows fetched per page by the inventory and sales history tables
+PAGE_SIZE = 200
+# How often the Tk loop checks on work running on the I/O pool
+BACKGROUND_POLL_MS = 50
+# Quiet period before a dashboard refresh requested from the filter controls runs
+REFRESH_DEBOUNCE_MS = 200
+# Typing pause after which the sales and customer searches run
+SEARCH_DEBOUNCE_MS = 250
+
+@functools.lru_cache(maxsize=8)
+def bar_colors(count):
+    # Blues gradient for the top-products bars; only a handful of bar counts ever occur
+    return plt.cm.Blues(np.linspace(0.2, 0.8, count))
+
+# Database Connection
+# A single long-lived connection is shared by every helper. Writes go through
+# transaction() (or record_sale, which finalize_sale runs on the I/O pool) and
+# hold _write_lock so transactions from different threads never interleave.
+# record_sale writes on a connection of its own, so reads on the Tk thread never
+# see (or cache) a sale that is still in flight.
+DB_PATH = "shopify_pos.db"
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+SQLITE_HAS_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+DB_PRAGMAS = '''
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+    PRAGMA busy_timeout=30000;
+    PRAGMA foreign_keys=ON;
+'''
+_conn = None
+_sale_conn = None
+_write_lock = threading.RLock()
+_transaction_state = threading.local()
+_read_conns = {}
+
+def open_connection(database=DB_PATH, uri=False):
+    conn = sqlite3.connect(database, uri=uri, check_same_thread=False, isolation_level=None, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(DB_PRAGMAS)
+    if os.environ.get("POS_SQL_TRACE"):
+        # Every statement SQLite runs is logged; handy for checking what each screen issues
+        conn.set_trace_callback(lambda sql: logger.info("SQL: %s", sql))
+    return conn
+
+def get_connection():
+    global _conn
+    if _conn is None:
+        _conn = open_connection()
+        logger.info("Opened database connection to %s", DB_PATH)
+    return _conn
+
+def get_sale_connection():
+    global _sale_conn
+    if _sale_conn is None:
+        _sale_conn = open_connection()
+        logger.info("Opened sale database connection to %s", DB_PATH)
+    return _sale_conn
+
+def get_read_connection():
+    # Reads that run on the I/O pool (sales history pages, the sales export) use a
+    # read-only connection per pool thread. Under WAL each statement sees the last
+    # committed state, never a sale still in flight on the shared connection.
+    conn = _read_conns.get(threading.get_ident())
+    if conn is None:
+        conn = open_connection(f"file:{DB_PATH}?mode=ro", uri=True)
+        _read_conns[threading.get_ident()] = conn
+        logger.info("Opened read-only database connection to %s", DB_PATH)
+    return conn
+
+def close_connection():
+    global _conn, _sale_conn
+    for conn in _read_conns.values():
+        conn.close()
+    _read_conns.clear()
+    if _sale_conn is not None:
+        _sale_conn.close()
+        _sale_conn = None
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+        logger.info("Database connection closed")
+
+@contextmanager
+def transaction():
+    with _write_lock:
+        conn = get_connection()
+        depth = getattr(_transaction_state, "depth", 0)
+        if depth:
+            # Nested use joins the enclosing transaction, so bulk callers can wrap many
+            # add_customer/add_product calls in one transaction() and commit once
+            _transaction_state.depth = depth + 1
+            try:
+                yield conn
+            finally:
+                _transaction_state.depth = depth
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        _transaction_state.depth = 1
+        changes = conn.total_changes
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            # A failed COMMIT lands here too, so the connection never stays mid-transaction
+            conn.rollback()
+            invalidate_cache()
+            raise
+        finally:
+            _transaction_state.depth = 0
+        # A transaction that wrote nothing (e.g. a duplicate customer) leaves the caches valid
+        if conn.total_changes != changes:
+            invalidate_cache()
+
+def retry_on_locked(attempts=5, delay=0.1):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e) or attempt == attempts:
+                        raise
+                    logger.warning("Database locked in %s, retrying (%s/%s)", func.__name__, attempt, attempts)
+                    time.sleep(delay * attempt)
+        return wrapper
+    return decorator
+
+def fetch_series(c, label_dtype=str):
+    # Turn (label, value) rows into arrays matplotlib can consume directly
+    rows = c.fetchall()
+    labels = np.array([r[0] for r in rows], dtype=label_dtype)
+    values = np.fromiter((r[1] or 0 for r in rows), dtype=np.float64, count=len(rows))
+    return labels, values
+
+def bucket_series(buckets, totals, labels, sort_by_total=True):
+    # Sum totals per bucket index in C and keep only buckets that had sales
+    sums = np.bincount(buckets, weights=totals, minlength=len(labels))
+    present = np.flatnonzero(np.bincount(buckets, minlength=len(labels)))
+    if sort_by_total:
+        present = present[np.argsort(-sums[present], kind="stable")]
+    return np.asarray(labels)[present], sums[present]
+
+def sale_months(c):
+    # Month numbers for SQL_SALE_MONTHS rows; an empty or malformed date casts to 0
+    # and is left out rather than filed under a wrong month
+    months, totals = fetch_series(c, label_dtype=np.int64)
+    valid = (months >= 1) & (months <= 12)
+    return months[valid], totals[valid]
+
+# Hot statements are kept as constants so every call sends identical SQL text
+# and hits the connection's prepared-statement cache.
+SQL_STOCK_DECREMENT = "UPDATE products SET stock = stock - ? WHERE id = ?"
+SQL_SALE_INSERT = ("INSERT INTO sales (product_id, quantity, total, discount, date, staff_id, payment_method, customer_id) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+SQL_INVENTORY_ALL = "SELECT * FROM products ORDER BY id LIMIT ? OFFSET ?"
+SQL_SALES_KPIS_SINCE = "SELECT SUM(total), SUM(quantity), AVG(total) FROM sales WHERE date >= ?"
+SQL_SALES_KPIS_ALL = "SELECT SUM(total), SUM(quantity), AVG(total) FROM sales"
+SQL_SALES_KPIS_BY_PERIOD = """
+    SELECT SUM(CASE WHEN date >= :today THEN total END), SUM(CASE WHEN date >= :today THEN quantity END),
+           AVG(CASE WHEN date >= :today THEN total END),
+           SUM(CASE WHEN date >= :week THEN total END), SUM(CASE WHEN date >= :week THEN quantity END),
+           AVG(CASE WHEN date >= :week THEN total END),
+           SUM(CASE WHEN date >= :month THEN total END), SUM(CASE WHEN date >= :month THEN quantity END),
+           AVG(CASE WHEN date >= :month THEN total END),
+           SUM(total), SUM(quantity), AVG(total)
+    FROM sales
+"""
+SQL_SALES_TREND = "SELECT date(date) as sale_date, SUM(total) as daily_total FROM sales WHERE date >= ? GROUP BY date(date) ORDER BY sale_date"
+# Weekly buckets are labelled by the Monday that starts the week
+SQL_SALES_TREND_WEEKLY = ("SELECT date(date, '-6 days', 'weekday 1') as week_start, SUM(total) as weekly_total "
+                          "FROM sales WHERE date >= ? GROUP BY week_start ORDER BY week_start")
+SQL_TOP_PRODUCTS = """
+    SELECT p.name, SUM(s.quantity) as total_sold, SUM(s.total) as total_revenue 
+    FROM sales s 
+    JOIN products p ON s.product_id = p.id 
+    GROUP BY p.id, p.name 
+    ORDER BY total_sold DESC 
+    LIMIT ?
+"""
+SQL_SALE_MONTHS = "SELECT CAST(substr(date, 6, 2) AS INTEGER), total FROM sales WHERE date IS NOT NULL"
+SQL_LOW_STOCK = "SELECT name, stock FROM products WHERE stock < 5"
+SQL_VERIFY_PIN = "SELECT id, name, role FROM staff WHERE pin = ?"
+SQL_CART_PRODUCT = "SELECT price, stock, name FROM products WHERE id = ?"
+SQL_CUSTOMER_ID_BY_NAME = "SELECT id FROM customers WHERE name = ?"
+SQL_CUSTOMER_ID_BY_EMAIL = "SELECT id FROM customers WHERE email = ?"
+# A duplicate email inserts nothing (and RETURNING yields no row) instead of raising
+SQL_CUSTOMER_INSERT = "INSERT INTO customers (name, email, points, age) VALUES (?, ?, ?, ?) ON CONFLICT(email) DO NOTHING"
+SQL_CUSTOMER_NAMES = "SELECT id, name FROM customers ORDER BY name"
+SQL_CUSTOMERS_ALL = "SELECT id, name, email, points FROM customers ORDER BY id"
+SQL_CUSTOMERS_LIKE = "SELECT id, name, email, points FROM customers WHERE name LIKE ? OR email LIKE ? ORDER BY id"
+SQL_CUSTOMERS_MATCH = ("SELECT id, name, email, points FROM customers "
+                       "WHERE id IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ?) ORDER BY id")
+SQL_CUSTOMER_HISTORY = ("SELECT id, product_id, quantity, printf('%.2f', total) AS total, "
+                        "printf('%.2f', discount) AS discount, date FROM sales "
+                        "WHERE customer_id = ? ORDER BY date DESC LIMIT ?")
+SQL_SALE_DELETE = "DELETE FROM sales WHERE id = ?"
+SQL_STOCK_RESTORE = "UPDATE products SET stock = stock + ? WHERE id = ?"
+SQL_SALES_EXPORT = """
+    SELECT s.id, s.product_id, s.quantity, printf('%.2f', s.total), printf('%.2f', s.discount), s.date,
+           st.name, s.payment_method, cu.name
+    FROM sales s
+    LEFT JOIN staff st ON st.id = s.staff_id
+    LEFT JOIN customers cu ON cu.id = s.customer_id
+    ORDER BY s.id
+"""
+SALES_EXPORT_HEADERS = ["id", "product_id", "quantity", "total", "discount", "date", "staff", "payment_method", "customer"]
+EXPORT_CHUNK_ROWS = 10000
+CUSTOMER_CHUNK_ROWS = 1000
+# Sales table and customer history rows come back formatted for display
+SQL_SALES_HISTORY = ("SELECT s.id, s.product_id, s.quantity, printf('%.2f', s.total) AS total, "
+                     "printf('%.2f', s.discount) AS discount, s.date, COALESCE(st.name, 'N/A') AS staff_name, "
+                     "s.payment_method, COALESCE(cu.name, 'N/A') AS customer_name FROM sales s "
+                     "LEFT JOIN staff st ON st.id = s.staff_id LEFT JOIN customers cu ON cu.id = s.customer_id")
+
+# Bucket definitions for the seasonal/monthly/age breakdowns
+MONTHS = [f"{m:02d}" for m in range(1, 13)]
+SEASONS = ["Spring", "Summer", "Fall", "Winter"]
+SEASON_OF_MONTH = np.array([3, 3, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3])
+AGE_GROUPS = ["0-18", "19-30", "31-45", "46-60", "61+"]
+AGE_GROUP_BINS = [19, 31, 46, 61]
+
+# Aggregate cache
+# Dashboard aggregates are cached for a short TTL keyed by function and
+# arguments; every committed write clears the cache.
+_cache = {}
+
+def cached(ttl=30):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            hit = _cache.get(key)
+            if hit and now - hit[0] < ttl:
+                return hit[1]
+            result = func(*args, **kwargs)
+            _cache[key] = (now, result)
+            return result
+        return wrapper
+    return decorator
+
+def invalidate_cache():
+    _cache.clear()
+
 # Database Functions
+# Schema, indexes and FTS triggers; setup_database runs it as a single transaction
+SCHEMA_SQL = '''
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    price REAL,
+    stock INTEGER,
+    category TEXT,
+    barcode TEXT UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER,
+    quantity INTEGER,
+    total REAL,
+    discount REAL DEFAULT 0,
+    date TEXT,
+    staff_id INTEGER,
+    payment_method TEXT,
+    customer_id INTEGER,
+    FOREIGN KEY(product_id) REFERENCES products(id),
+    FOREIGN KEY(staff_id) REFERENCES staff(id),
+    FOREIGN KEY(customer_id) REFERENCES customers(id)
+);
+CREATE TABLE IF NOT EXISTS customers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    email TEXT UNIQUE,
+    points INTEGER DEFAULT 0,
+    age INTEGER
+);
+CREATE TABLE IF NOT EXISTS staff (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    pin TEXT UNIQUE,
+    role TEXT
+);
+-- Dashboard aggregates filter on sales.date and join on the foreign keys; the
+-- date and product indexes also carry total/quantity so period summaries, the
+-- trend chart and top products are answered from the index alone.
+CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(date, total, quantity);
+DROP INDEX IF EXISTS idx_sales_product;
+CREATE INDEX IF NOT EXISTS idx_sales_product_totals ON sales(product_id, quantity, total);
+CREATE INDEX IF NOT EXISTS idx_sales_staff ON sales(staff_id);
+-- Customer history reads one customer's sales newest first straight off this index
+DROP INDEX IF EXISTS idx_sales_customer;
+CREATE INDEX IF NOT EXISTS idx_sales_customer_date ON sales(customer_id, date);
+-- Sale screen customer lookup by name and the name-ordered customer list
+CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name);
+-- LIKE is case-insensitive, so prefix searches need NOCASE indexes to seek
+CREATE INDEX IF NOT EXISTS idx_customers_name_nocase ON customers(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_customers_email_nocase ON customers(email COLLATE NOCASE);
+-- Full-text index over product name/barcode, kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(name, barcode, content='products', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, name, barcode) VALUES (new.id, new.name, new.barcode);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, barcode ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode);
+    INSERT INTO products_fts(rowid, name, barcode) VALUES (new.id, new.name, new.barcode);
+END;
+'''
+SQL_FTS_REBUILD = "INSERT INTO products_fts(products_fts) VALUES ('rebuild');"
+# Trigram index for "contains" customer searches (needs SQLite 3.34+)
+CUSTOMERS_FTS_SQL = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(name, email, content='customers', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN
+    INSERT INTO customers_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+END;
+CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN
+    INSERT INTO customers_fts(customers_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+END;
+CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE OF name, email ON customers BEGIN
+    INSERT INTO customers_fts(customers_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+    INSERT INTO customers_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+END;
+'''
+SQL_CUSTOMERS_FTS_REBUILD = "INSERT INTO customers_fts(customers_fts) VALUES ('rebuild');"
+# Trigram index for sales history searches. Product and staff names live in other
+# tables, so this FTS table keeps its own copy of them, written when the sale is.
+SALES_FTS_SQL = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS sales_fts USING fts5(product_name, staff_name, payment_method, date, tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS sales_fts_ai AFTER INSERT ON sales BEGIN
+    INSERT INTO sales_fts(rowid, product_name, staff_name, payment_method, date)
+    VALUES (new.id, (SELECT name FROM products WHERE id = new.product_id),
+            (SELECT name FROM staff WHERE id = new.staff_id), new.payment_method, new.date);
+END;
+CREATE TRIGGER IF NOT EXISTS sales_fts_ad AFTER DELETE ON sales BEGIN
+    DELETE FROM sales_fts WHERE rowid = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS sales_fts_au AFTER UPDATE OF product_id, staff_id, payment_method, date ON sales BEGIN
+    DELETE FROM sales_fts WHERE rowid = old.id;
+    INSERT INTO sales_fts(rowid, product_name, staff_name, payment_method, date)
+    VALUES (new.id, (SELECT name FROM products WHERE id = new.product_id),
+            (SELECT name FROM staff WHERE id = new.staff_id), new.payment_method, new.date);
+END;
+'''
+SQL_SALES_FTS_REBUILD = '''
+INSERT INTO sales_fts(rowid, product_name, staff_name, payment_method, date)
+SELECT s.id, p.name, st.name, s.payment_method, s.date FROM sales s
+LEFT JOIN products p ON p.id = s.product_id LEFT JOIN staff st ON st.id = s.staff_id;
+'''
+
 def setup_database():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS products (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT,
-                        price REAL,
-                        stock INTEGER,
-                        category TEXT,
-                        barcode TEXT UNIQUE
-                    )''')
-        c.execute('''CREATE TABLE IF NOT EXISTS sales (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        product_id INTEGER,
-                        quantity INTEGER,
-                        total REAL,
-                        discount REAL DEFAULT 0,
-                        date TEXT,
-                        staff_id INTEGER,
-                        payment_method TEXT,
-                        customer_id INTEGER,
-                        FOREIGN KEY(product_id) REFERENCES products(id),
-                        FOREIGN KEY(staff_id) REFERENCES staff(id),
-                        FOREIGN KEY(customer_id) REFERENCES customers(id)
-                    )''')
-        c.execute('''CREATE TABLE IF NOT EXISTS customers (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT,
-                        email TEXT UNIQUE,
-                        points INTEGER DEFAULT 0,
-                        age INTEGER
-                    )''')
-        c.execute('''CREATE TABLE IF NOT EXISTS staff (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT,
-                        pin TEXT UNIQUE,
-                        role TEXT
-                    )''')
-        conn.commit()
+    conn = get_connection()
+    c = conn.cursor()
+    if c.execute("PRAGMA page_count").fetchone()[0] == 0:
+        # Page size and auto-vacuum only take effect before the first table is created
+        # (an existing file would need a full VACUUM), so set them on new databases only
+        c.execute("PRAGMA page_size=8192")
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        logger.info("Initialized new database file %s", DB_PATH)
+    # WAL persists in the database file and must be set outside a transaction;
+    # the per-connection PRAGMAs live in DB_PRAGMAS
+    c.execute("PRAGMA journal_mode=WAL")
+    existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE name IN ('products_fts', 'customers_fts', 'sales_fts')")}
+    fts_exists = "products_fts" in existing
+    script = SCHEMA_SQL if fts_exists else SCHEMA_SQL + SQL_FTS_REBUILD
+    if SQLITE_HAS_TRIGRAM:
+        script += CUSTOMERS_FTS_SQL if "customers_fts" in existing else CUSTOMERS_FTS_SQL + SQL_CUSTOMERS_FTS_REBUILD
+        script += SALES_FTS_SQL if "sales_fts" in existing else SALES_FTS_SQL + SQL_SALES_FTS_REBUILD
+    try:
+        c.executescript(f"BEGIN IMMEDIATE;\n{script}\nCOMMIT;")
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    if not fts_exists:
+        logger.info("Built products_fts index from existing products")
     logger.info("Database setup completed successfully.")
 
+def bootstrap_admin():
+    # Seed rows for a fresh database, written in one transaction on the shared connection
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO staff (id, name, pin, role) VALUES (1, 'Admin', '1234', 'admin')")
+    logger.info("Default admin account ensured")
+
+@retry_on_locked()
 def add_product(name, price, stock, category):
     barcode = f"{name}_{price}_{datetime.now().strftime('%H%M%S')}"
     try:
-        with sqlite3.connect("shopify_pos.db") as conn:
+        with transaction() as conn:
             c = conn.cursor()
-            logger.info(f"Attempting to insert product: name={name}, price={price}, stock={stock}, category={category}, barcode={barcode}")
+            logger.debug("Attempting to insert product: name=%s, price=%s, stock=%s, category=%s, barcode=%s", name, price, stock, category, barcode)
             c.execute("INSERT INTO products (name, price, stock, category, barcode) VALUES (?, ?, ?, ?, ?)",
                       (name, price, stock, category, barcode))
-            conn.commit()
-            logger.info(f"Successfully inserted product: {name} with barcode {barcode} into database.")
-        barcode_path = generate_barcode(barcode)
-        logger.info(f"Barcode generated for {name} at {barcode_path}.")
+            logger.info("Successfully inserted product: %s with barcode %s into database.", name, barcode)
+        # The row is committed; render the PNG off the UI thread (generate_barcode logs its own result)
+        _io_pool.submit(generate_barcode, barcode)
+        logger.debug("Barcode rendering queued for %s.", name)
         return barcode
     except sqlite3.IntegrityError as e:
-        logger.error(f"Database integrity error: {e} - Likely duplicate barcode {barcode}")
+        logger.error("Database integrity error: %s - Likely duplicate barcode %s", e, barcode)
         raise ValueError(f"Duplicate barcode {barcode}. Try again.")
     except Exception as e:
-        logger.error(f"Failed to add product {name}: {e}\n{traceback.format_exc()}")
+        logger.exception("Failed to add product %s: %s", name, e)
         raise
 
+@retry_on_locked()
 def adjust_stock(product_id, new_stock):
     try:
-        with sqlite3.connect("shopify_pos.db") as conn:
+        with transaction() as conn:
             c = conn.cursor()
-            logger.info(f"Adjusting stock for product ID {product_id} to new value: {new_stock}")
+            logger.debug("Adjusting stock for product ID %s to new value: %s", product_id, new_stock)
             c.execute("UPDATE products SET stock = ? WHERE id = ?", (new_stock, product_id))
-            conn.commit()
-            logger.info(f"Stock successfully set to {new_stock} for product ID {product_id}")
+            logger.info("Stock successfully set to %s for product ID %s", new_stock, product_id)
     except Exception as e:
-        logger.error(f"Failed to adjust stock for product ID {product_id} to {new_stock}: {e}\n{traceback.format_exc()}")
+        logger.exception("Failed to adjust stock for product ID %s to %s: %s", product_id, new_stock, e)
         raise
 
+@retry_on_locked()
 def delete_product(product_id):
     try:
-        with sqlite3.connect("shopify_pos.db") as conn:
+        with transaction() as conn:
             c = conn.cursor()
-            logger.info(f"Attempting to delete product with ID {product_id}")
+            logger.debug("Attempting to delete product with ID %s", product_id)
             c.execute("DELETE FROM sales WHERE product_id = ?", (product_id,))
-            logger.info(f"Deleted associated sales for product ID {product_id}")
+            logger.debug("Deleted associated sales for product ID %s", product_id)
             c.execute("DELETE FROM products WHERE id = ?", (product_id,))
-            conn.commit()
-            logger.info(f"Product ID {product_id} successfully deleted from database")
+            logger.info("Product ID %s successfully deleted from database", product_id)
     except Exception as e:
-        logger.error(f"Failed to delete product ID {product_id}: {e}\n{traceback.format_exc()}")
+        logger.exception("Failed to delete product ID %s: %s", product_id, e)
         raise
 
-def get_inventory(search_term=""):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        if search_term:
-            logger.info(f"Searching inventory with term: '{search_term}'")
-            c.execute("SELECT * FROM products WHERE name LIKE ? OR id LIKE ? OR barcode LIKE ?", 
-                      (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
-        else:
-            logger.info("Retrieving full inventory list")
-            c.execute("SELECT * FROM products")
-        products = c.fetchall()
-    logger.info(f"Retrieved {len(products)} products from inventory with search term '{search_term}'")
+def fts_query(search_term):
+    # Quote each word and prefix-match it so user input never hits FTS5 query syntax
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", search_term))
+
+def get_inventory(search_term="", limit=PAGE_SIZE, offset=0):
+    # limit=None returns every matching row (SQLite treats a negative LIMIT as unbounded)
+    conn = get_connection()
+    c = conn.cursor()
+    search_term = search_term.strip()
+    page = (-1 if limit is None else limit, offset)
+    if search_term.isdigit():
+        logger.debug("Searching inventory by ID/barcode number: '%s'", search_term)
+        c.execute("SELECT * FROM products WHERE id = ? OR id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?) "
+                  "ORDER BY id LIMIT ? OFFSET ?", (int(search_term), fts_query(search_term)) + page)
+    elif fts_query(search_term):
+        logger.debug("Searching inventory with term: '%s'", search_term)
+        c.execute("SELECT * FROM products WHERE id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?) "
+                  "ORDER BY id LIMIT ? OFFSET ?", (fts_query(search_term),) + page)
+    elif search_term:
+        logger.debug("Search term '%s' has no searchable words", search_term)
+        return []
+    else:
+        logger.debug("Retrieving inventory list from offset %s", offset)
+        c.execute(SQL_INVENTORY_ALL, page)
+    products = c.fetchall()
+    logger.debug("Retrieved %s products from inventory with search term '%s'", len(products), search_term)
     return products
 
 def record_sale(cart_items, staff_id, payment_method, discount=0, customer_id=None):
-    with sqlite3.connect("shopify_pos.db") as conn:
+    with _write_lock:
+        conn = get_sale_connection()
         c = conn.cursor()
-        conn.execute("BEGIN TRANSACTION")
+        c.execute("BEGIN IMMEDIATE")
         try:
             date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             total_sale = 0
-            logger.info(f"Recording sale: Staff ID {staff_id}, Payment Method {payment_method}, Discount {discount}, Customer ID {customer_id}, Date {date}")
+            required = {}
+            logger.debug("Recording sale: Staff ID %s, Payment Method %s, Discount %s, Customer ID %s, Date %s", staff_id, payment_method, discount, customer_id, date)
             for product_id, quantity, price in cart_items:
-                c.execute("SELECT stock, name FROM products WHERE id = ?", (product_id,))
-                result = c.fetchone()
-                stock, name = result["stock"], result["name"]
-                logger.info(f"Checking stock for product ID {product_id} ({name}): required {quantity}, available {stock}")
-                if stock < quantity:
+                required[product_id] = required.get(product_id, 0) + quantity
+                total_sale += price * quantity
+            placeholders = ",".join("?" * len(required))
+            c.execute(f"SELECT id, name, stock FROM products WHERE id IN ({placeholders})", tuple(required))
+            available = {row["id"]: row for row in c.fetchall()}
+            for product_id, quantity in required.items():
+                row = available.get(product_id)
+                if row is None or row["stock"] < quantity:
                     conn.rollback()
-                    logger.error(f"Not enough stock for product ID {product_id} ({name}): required {quantity}, available {stock}")
-                    return None, None
-                total = price * quantity
-                total_sale += total
-                c.execute("UPDATE products SET stock = stock - ? WHERE id = ?", (quantity, product_id))
-                logger.info(f"Updated stock for product ID {product_id} ({name}): reduced by {quantity}, new stock {stock - quantity}")
+                    logger.error("Not enough stock for product ID %s (%s): required %s, available %s", product_id, row['name'] if row else 'unknown', quantity, row['stock'] if row else 0)
+                    return None, None, None
+            c.executemany(SQL_STOCK_DECREMENT, [(quantity, product_id) for product_id, quantity in required.items()])
+            logger.debug("Updated stock for %s products", len(required))
             total_sale -= discount
-            for product_id, quantity, _ in cart_items:
-                c.execute("INSERT INTO sales (product_id, quantity, total, discount, date, staff_id, payment_method, customer_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                          (product_id, quantity, total_sale / len(cart_items), discount / len(cart_items), date, staff_id, payment_method, customer_id))
+            n = len(cart_items)
+            sales_rows = [(product_id, quantity, total_sale / n, discount / n, date, staff_id, payment_method, customer_id)
+                          for product_id, quantity, _ in cart_items]
+            c.executemany(SQL_SALE_INSERT, sales_rows)
+            # Id of the sale's last row; unique across runs, so it names the receipt
+            sale_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
             conn.commit()
-            logger.info(f"Sale successfully recorded: Total {total_sale}, Date {date}, Staff ID {staff_id}, Customer ID {customer_id}, Items {len(cart_items)}")
-            return total_sale, date
+            invalidate_cache()
+            logger.info("Sale successfully recorded: Total %s, Date %s, Staff ID %s, Customer ID %s, Items %s", total_sale, date, staff_id, customer_id, len(cart_items))
+            return total_sale, date, sale_id
         except Exception as e:
             conn.rollback()
-            logger.error(f"Sale recording failed: {e}\n{traceback.format_exc()}")
-            return None, None
+            invalidate_cache()
+            logger.exception("Sale recording failed: %s", e)
+            return None, None, None
 
+@retry_on_locked()
 def add_customer(name, email, points=0, age=None):
     try:
-        with sqlite3.connect("shopify_pos.db") as conn:
-            c = conn.cursor()
-            logger.info(f"Attempting to add customer: name={name}, email={email}, points={points}, age={age}")
-            c.execute("INSERT INTO customers (name, email, points, age) VALUES (?, ?, ?, ?)", (name, email, points, age))
-            conn.commit()
-            customer_id = c.lastrowid
-            logger.info(f"Customer {name} successfully added with ID {customer_id}")
-            return customer_id
-    except sqlite3.IntegrityError:
-        with sqlite3.connect("shopify_pos.db") as conn:
+        with transaction() as conn:
             c = conn.cursor()
-            c.execute("SELECT id FROM customers WHERE email = ?", (email,))
-            customer_id = c.fetchone()[0]
-            logger.info(f"Customer {name} already exists with email {email}, ID {customer_id}")
+            logger.debug("Attempting to add customer: name=%s, email=%s, points=%s, age=%s", name, email, points, age)
+            # New customers take a single statement; only a duplicate email needs the lookup
+            if SQLITE_HAS_RETURNING:
+                c.execute(SQL_CUSTOMER_INSERT + " RETURNING id", (name, email, points, age))
+                row = c.fetchone()
+                customer_id = row[0] if row else None
+            else:
+                c.execute(SQL_CUSTOMER_INSERT, (name, email, points, age))
+                customer_id = c.lastrowid if c.rowcount == 1 else None
+            if customer_id is not None:
+                logger.info("Customer %s successfully added with ID %s", name, customer_id)
+                return customer_id
+            customer_id = c.execute(SQL_CUSTOMER_ID_BY_EMAIL, (email,)).fetchone()[0]
+            logger.info("Customer %s already exists with email %s, ID %s", name, email, customer_id)
             return customer_id
     except Exception as e:
-        logger.error(f"Failed to add customer {name}: {e}\n{traceback.format_exc()}")
+        logger.exception("Failed to add customer %s: %s", name, e)
         raise
 
 def get_customers():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Retrieving list of customers")
-        c.execute("SELECT id, name FROM customers ORDER BY name")
-        customers = c.fetchall()
-    logger.info(f"Retrieved {len(customers)} customers from database")
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Retrieving list of customers")
+    c.execute(SQL_CUSTOMER_NAMES)
+    customers = c.fetchall()
+    logger.debug("Retrieved %s customers from database", len(customers))
     return customers
 
+def search_customers(search_term="", contains=False):
+    # Default is a prefix match that seeks the NOCASE indexes; contains=True finds
+    # substrings through the trigram index (which needs at least three characters).
+    # Rows are yielded in fetchmany chunks so callers never hold the whole result
+    # as sqlite3.Row objects.
+    conn = get_connection()
+    c = conn.cursor()
+    search_term = search_term.strip()
+    if not search_term:
+        logger.debug("Retrieving all customers")
+        c.execute(SQL_CUSTOMERS_ALL)
+    elif contains and SQLITE_HAS_TRIGRAM and len(search_term) >= 3:
+        logger.debug("Searching customers containing '%s'", search_term)
+        c.execute(SQL_CUSTOMERS_MATCH, ('"' + search_term.replace('"', '""') + '"',))
+    elif contains:
+        logger.debug("Scanning customers containing '%s'", search_term)
+        c.execute(SQL_CUSTOMERS_LIKE, (f"%{search_term}%", f"%{search_term}%"))
+    else:
+        logger.debug("Searching customers starting with '%s'", search_term)
+        c.execute(SQL_CUSTOMERS_LIKE, (f"{search_term}%", f"{search_term}%"))
+    count = 0
+    while chunk := c.fetchmany(CUSTOMER_CHUNK_ROWS):
+        count += len(chunk)
+        yield from chunk
+    logger.debug("Retrieved %s customers for search '%s'", count, search_term)
+
+@functools.lru_cache(maxsize=1)
+def _period_cutoffs(now):
+    fmt = "%Y-%m-%d %H:%M:%S"
+    return {
+        "today": now.replace(hour=0, minute=0).strftime(fmt),
+        "week": (now - timedelta(days=7)).strftime(fmt),
+        "month": (now - timedelta(days=30)).strftime(fmt),
+    }
+
+def get_period_cutoffs():
+    # Cutoffs are minute-granular: the ISO strings are formatted once a minute and
+    # shared by every dashboard query in between
+    return _period_cutoffs(datetime.now().replace(second=0, microsecond=0))
+
+@cached()
+def get_sales_kpis(period="all"):
+    # Revenue, items sold and average sale value for a period in one scan
+    conn = get_connection()
+    c = conn.cursor()
+    start_date = get_period_cutoffs().get(period)
+    if start_date:
+        logger.debug("Fetching sales KPIs for %s since %s", period, start_date)
+        c.execute(SQL_SALES_KPIS_SINCE, (start_date,))
+    else:
+        logger.debug("Fetching all-time sales KPIs")
+        c.execute(SQL_SALES_KPIS_ALL)
+    result = c.fetchone()
+    total, items, avg = result[0] or 0, result[1] or 0, result[2] or 0
+    logger.debug("Sales KPIs for %s: Total %s DZD, Items sold %s, Average %.2f DZD", period, total, items, avg)
+    return total, items, avg
+
+@cached()
+def get_sales_summary_all():
+    # KPIs for today/week/month/all in a single pass over the covering date index
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching sales KPIs for all periods")
+    c.execute(SQL_SALES_KPIS_BY_PERIOD, get_period_cutoffs())
+    row = [value or 0 for value in c.fetchone()]
+    summary = {period: tuple(row[i:i + 3]) for i, period in zip(range(0, 12, 3), ("today", "week", "month", "all"))}
+    logger.debug("Sales KPIs by period: %s", summary)
+    return summary
+
 def get_sales_summary(period="all"):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        c = conn.cursor()
-        if period == "today":
-            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Fetching sales summary for today since {start_date}")
-            c.execute("SELECT SUM(total), SUM(quantity) FROM sales WHERE date >= ?", (start_date,))
-        elif period == "week":
-            start_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Fetching sales summary for week since {start_date}")
-            c.execute("SELECT SUM(total), SUM(quantity) FROM sales WHERE date >= ?", (start_date,))
-        elif period == "month":
-            start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Fetching sales summary for month since {start_date}")
-            c.execute("SELECT SUM(total), SUM(quantity) FROM sales WHERE date >= ?", (start_date,))
-        else:
-            logger.info("Fetching all-time sales summary")
-            c.execute("SELECT SUM(total), SUM(quantity) FROM sales")
-        result = c.fetchone()
-        total, items = result[0] or 0, result[1] or 0
-    logger.info(f"Sales summary for {period}: Total {total} DZD, Items sold {items}")
+    total, items, _ = get_sales_kpis(period)
     return total, items
 
 def get_avg_sale_value(period="all"):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        c = conn.cursor()
-        if period == "today":
-            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Calculating average sale value for today since {start_date}")
-            c.execute("SELECT AVG(total) FROM sales WHERE date >= ?", (start_date,))
-        elif period == "week":
-            start_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Calculating average sale value for week since {start_date}")
-            c.execute("SELECT AVG(total) FROM sales WHERE date >= ?", (start_date,))
-        elif period == "month":
-            start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Calculating average sale value for month since {start_date}")
-            c.execute("SELECT AVG(total) FROM sales WHERE date >= ?", (start_date,))
-        else:
-            logger.info("Calculating all-time average sale value")
-            c.execute("SELECT AVG(total) FROM sales")
-        result = c.fetchone()
-        avg = result[0] or 0
-    logger.info(f"Average sale value for {period}: {avg:.2f} DZD")
-    return avg
-
-def get_sales_trend(days=7):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        logger.info(f"Fetching sales trend for last {days} days since {start_date}")
-        c.execute("SELECT date(date) as sale_date, SUM(total) as daily_total FROM sales WHERE date >= ? GROUP BY date(date) ORDER BY sale_date", (start_date,))
-        trend = c.fetchall()
-        logger.info(f"Retrieved sales trend: {len(trend)} days with data - {[(t['sale_date'], t['daily_total']) for t in trend]}")
-    return trend
-
+    return get_sales_kpis(period)[2]
+
+@cached()
+def get_sales_trend(days=7, bucket="day"):
+    conn = get_connection()
+    c = conn.cursor()
+    start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    logger.debug("Fetching %sly sales trend for last %s days since %s", bucket, days, start_date)
+    c.execute(SQL_SALES_TREND_WEEKLY if bucket == "week" else SQL_SALES_TREND, (start_date,))
+    # Day-resolution datetime64 labels go straight into the cached trend Line2D
+    dates, totals = fetch_series(c, label_dtype="datetime64[D]")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Retrieved sales trend: %s days with data - %s", len(dates), list(zip(dates.tolist(), totals.tolist())))
+    return dates, totals
+
+@cached()
 def get_top_products(limit=5):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info(f"Fetching top {limit} products by quantity sold")
-        c.execute("""
-            SELECT p.name, SUM(s.quantity) as total_sold, SUM(s.total) as total_revenue 
-            FROM sales s 
-            JOIN products p ON s.product_id = p.id 
-            GROUP BY p.id, p.name 
-            ORDER BY total_sold DESC 
-            LIMIT ?
-        """, (limit,))
-        products = c.fetchall()
-        logger.info(f"Retrieved {len(products)} top products - {[(p['name'], p['total_sold'], p['total_revenue']) for p in products]}")
+    # limit=None ranks every product that has sales
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching top %s products by quantity sold", limit)
+    c.execute(SQL_TOP_PRODUCTS, (-1 if limit is None else limit,))
+    products = c.fetchall()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Retrieved %s top products - %s", len(products), [(p['name'], p['total_sold'], p['total_revenue']) for p in products])
     return products
 
+@cached()
 def get_category_sales():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Fetching sales by category")
-        c.execute("""
-            SELECT p.category, SUM(s.total) as total_sales 
-            FROM sales s 
-            JOIN products p ON s.product_id = p.id 
-            GROUP BY p.category 
-            ORDER BY total_sales DESC
-        """)
-        categories = c.fetchall()
-    logger.info(f"Retrieved sales for {len(categories)} categories")
-    return categories
-
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching sales by category")
+    c.execute("""
+        SELECT p.category, SUM(s.total) as total_sales 
+        FROM sales s 
+        JOIN products p ON s.product_id = p.id 
+        GROUP BY p.category 
+        ORDER BY total_sales DESC
+    """)
+    categories, totals = fetch_series(c)
+    logger.debug("Retrieved sales for %s categories", len(categories))
+    return categories, totals
+
+@cached()
 def get_staff_performance():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Fetching staff performance data")
-        c.execute("""
-            SELECT st.name, SUM(s.total) as total_sales, SUM(s.quantity) as items_sold 
-            FROM sales s 
-            JOIN staff st ON s.staff_id = st.id 
-            GROUP BY st.id, st.name 
-            ORDER BY total_sales DESC
-        """)
-        staff = c.fetchall()
-    logger.info(f"Retrieved performance for {len(staff)} staff members")
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching staff performance data")
+    c.execute("""
+        SELECT st.name, SUM(s.total) as total_sales, SUM(s.quantity) as items_sold 
+        FROM sales s 
+        JOIN staff st ON s.staff_id = st.id 
+        GROUP BY st.id, st.name 
+        ORDER BY total_sales DESC
+    """)
+    staff = c.fetchall()
+    logger.debug("Retrieved performance for %s staff members", len(staff))
     return staff
 
+@cached()
 def get_top_customer():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Fetching top customer by total spent")
-        c.execute("""
-            SELECT c.name, SUM(s.total) as total_spent 
-            FROM sales s 
-            JOIN customers c ON s.customer_id = c.id 
-            GROUP BY c.id, c.name 
-            ORDER BY total_spent DESC 
-            LIMIT 1
-        """)
-        customer = c.fetchone()
-    logger.info(f"Top customer: {customer['name'] if customer else 'None'} with total spent {customer['total_spent'] if customer else 0:.2f} DZD")
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching top customer by total spent")
+    c.execute("""
+        SELECT c.name, SUM(s.total) as total_spent 
+        FROM sales s 
+        JOIN customers c ON s.customer_id = c.id 
+        GROUP BY c.id, c.name 
+        ORDER BY total_spent DESC 
+        LIMIT 1
+    """)
+    customer = c.fetchone()
+    logger.debug("Top customer: %s with total spent %.2f DZD", customer['name'] if customer else 'None', customer['total_spent'] if customer else 0)
     return customer
 
+@cached()
 def get_low_stock():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Fetching low stock items (stock < 5)")
-        c.execute("SELECT name, stock FROM products WHERE stock < 5")
-        low_stock = c.fetchall()
-    logger.info(f"Found {len(low_stock)} items with low stock")
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching low stock items (stock < 5)")
+    c.execute(SQL_LOW_STOCK)
+    low_stock = c.fetchall()
+    logger.debug("Found %s items with low stock", len(low_stock))
     return low_stock
 
-def get_sales_history(search_term=""):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        if search_term:
-            logger.info(f"Fetching sales history with search term: '{search_term}'")
-            c.execute("SELECT * FROM sales WHERE product_id LIKE ? OR date LIKE ?", (f"%{search_term}%", f"%{search_term}%"))
-        else:
-            logger.info("Fetching full sales history")
-            c.execute("SELECT * FROM sales")
-        sales = c.fetchall()
-    logger.info(f"Retrieved {len(sales)} sales records")
+def get_sales_history(search_term="", limit=PAGE_SIZE, before_id=None):
+    # Newest sales first, with staff/customer names joined in; limit=None returns every
+    # matching row. Pages are keyed on the last sale id shown (before_id), which seeks
+    # straight to the next page where OFFSET would re-read every skipped row.
+    conn = get_read_connection()
+    c = conn.cursor()
+    search_term = search_term.strip()
+    conditions, params = [], []
+    if search_term.isdigit():
+        logger.debug("Fetching sales history for product ID %s", search_term)
+        conditions.append("s.product_id = ?")
+        params.append(int(search_term))
+    elif re.fullmatch(r"\d{4}-[\d\-: ]*", search_term):
+        # A date prefix becomes a range on the date index: '2024-05' -> ['2024-05', '2024-06')
+        upper = search_term[:-1] + chr(ord(search_term[-1]) + 1)
+        logger.debug("Fetching sales history for dates from %s to %s", search_term, upper)
+        conditions.append("s.date >= ? AND s.date < ?")
+        params += [search_term, upper]
+    elif SQLITE_HAS_TRIGRAM and len(search_term) >= 3:
+        # Trigram MATCH on a quoted phrase finds the text anywhere in the product name,
+        # staff name, payment method or date without scanning sales
+        logger.debug("Matching sales history against '%s'", search_term)
+        conditions.append("s.id IN (SELECT rowid FROM sales_fts WHERE sales_fts MATCH ?)")
+        params.append('"' + search_term.replace('"', '""') + '"')
+    elif search_term:
+        logger.debug("Fetching sales history with search term: '%s'", search_term)
+        conditions.append("s.date LIKE ?")
+        params.append(f"%{search_term}%")
+    else:
+        logger.debug("Fetching sales history before sale ID %s", before_id)
+    if before_id is not None:
+        conditions.append("s.id < ?")
+        params.append(before_id)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    c.execute(f"{SQL_SALES_HISTORY}{where} ORDER BY s.id DESC LIMIT ?", (*params, -1 if limit is None else limit))
+    sales = c.fetchall()
+    logger.debug("Retrieved %s sales records", len(sales))
     return sales
 
-def get_customer_history(customer_id):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info(f"Fetching purchase history for customer ID {customer_id}")
-        c.execute("SELECT * FROM sales WHERE customer_id = ?", (customer_id,))
-        history = c.fetchall()
-    logger.info(f"Retrieved {len(history)} sales for customer ID {customer_id}")
+def get_customer_history(customer_id, limit=None):
+    # limit=None returns the customer's whole history
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching purchase history for customer ID %s", customer_id)
+    c.execute(SQL_CUSTOMER_HISTORY, (customer_id, -1 if limit is None else limit))
+    history = c.fetchall()
+    logger.debug("Retrieved %s sales for customer ID %s", len(history), customer_id)
     return history
 
+@cached()
 def get_sales_by_season():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Fetching sales by season")
-        c.execute("""
-            SELECT 
-                CASE 
-                    WHEN strftime('%m', date) IN ('03', '04', '05') THEN 'Spring'
-                    WHEN strftime('%m', date) IN ('06', '07', '08') THEN 'Summer'
-                    WHEN strftime('%m', date) IN ('09', '10', '11') THEN 'Fall'
-                    ELSE 'Winter'
-                END as season,
-                SUM(total) as total_sales
-            FROM sales
-            GROUP BY season
-            ORDER BY total_sales DESC
-        """)
-        seasons = c.fetchall()
-        logger.info(f"Retrieved sales for {len(seasons)} seasons - {[(s['season'], s['total_sales']) for s in seasons]}")
-    return seasons
-
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching sales by season")
+    c.execute(SQL_SALE_MONTHS)
+    months, totals = sale_months(c)
+    seasons, totals = bucket_series(SEASON_OF_MONTH[months - 1], totals, SEASONS)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Retrieved sales for %s seasons - %s", len(seasons), list(zip(seasons.tolist(), totals.tolist())))
+    return seasons, totals
+
+@cached()
 def get_sales_by_month():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Fetching sales by month")
-        c.execute("""
-            SELECT strftime('%m', date) as month, SUM(total) as total_sales
-            FROM sales
-            GROUP BY month
-            ORDER BY month
-        """)
-        months = c.fetchall()
-    logger.info(f"Retrieved sales for {len(months)} months")
-    return months
-
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching sales by month")
+    c.execute(SQL_SALE_MONTHS)
+    months, totals = sale_months(c)
+    months, totals = bucket_series(months - 1, totals, MONTHS, sort_by_total=False)
+    logger.debug("Retrieved sales for %s months", len(months))
+    return months, totals
+
+@cached()
 def get_sales_by_age_group():
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info("Fetching sales by age group")
-        c.execute("""
-            SELECT 
-                CASE 
-                    WHEN c.age BETWEEN 0 AND 18 THEN '0-18'
-                    WHEN c.age BETWEEN 19 AND 30 THEN '19-30'
-                    WHEN c.age BETWEEN 31 AND 45 THEN '31-45'
-                    WHEN c.age BETWEEN 46 AND 60 THEN '46-60'
-                    ELSE '61+'
-                END as age_group,
-                SUM(s.total) as total_sales
-            FROM sales s
-            JOIN customers c ON s.customer_id = c.id
-            WHERE c.age IS NOT NULL
-            GROUP BY age_group
-            ORDER BY total_sales DESC
-        """)
-        age_groups = c.fetchall()
-    logger.info(f"Retrieved sales for {len(age_groups)} age groups")
-    return age_groups
-
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Fetching sales by age group")
+    c.execute("""
+        SELECT c.age, s.total
+        FROM sales s
+        JOIN customers c ON s.customer_id = c.id
+        WHERE c.age IS NOT NULL
+    """)
+    ages, totals = fetch_series(c, label_dtype=np.int64)
+    valid = ages >= 0
+    ages, totals = ages[valid], totals[valid]
+    age_groups, totals = bucket_series(np.digitize(ages, AGE_GROUP_BINS), totals, AGE_GROUPS)
+    logger.debug("Retrieved sales for %s age groups", len(age_groups))
+    return age_groups, totals
+
+@retry_on_locked()
 def add_staff(name, pin, role="staff"):
     try:
-        with sqlite3.connect("shopify_pos.db") as conn:
+        with transaction() as conn:
             c = conn.cursor()
-            logger.info(f"Adding staff: name={name}, pin={pin}, role={role}")
+            logger.debug("Adding staff: name=%s, pin=%s, role=%s", name, pin, role)
             c.execute("INSERT INTO staff (name, pin, role) VALUES (?, ?, ?)", (name, pin, role))
-            conn.commit()
-            logger.info(f"Staff {name} added successfully with PIN {pin}")
+            logger.info("Staff %s added successfully with PIN %s", name, pin)
     except Exception as e:
-        logger.error(f"Failed to add staff {name}: {e}\n{traceback.format_exc()}")
+        logger.exception("Failed to add staff %s: %s", name, e)
         raise
 
 def verify_staff_pin(pin):
-    with sqlite3.connect("shopify_pos.db") as conn:
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        logger.info(f"Verifying staff PIN: {pin}")
-        c.execute("SELECT id, name, role FROM staff WHERE pin = ?", (pin,))
-        staff = c.fetchone()
+    conn = get_connection()
+    c = conn.cursor()
+    logger.debug("Verifying staff PIN: %s", pin)
+    c.execute(SQL_VERIFY_PIN, (pin,))
+    staff = c.fetchone()
     if staff:
-        logger.info(f"Staff verified: {staff['name']} with ID {staff['id']}")
+        logger.info("Staff verified: %s with ID %s", staff['name'], staff['id'])
     else:
-        logger.warning(f"Staff PIN verification failed for PIN {pin}")
+        logger.warning("Staff PIN verification failed for PIN %s", pin)
     return staff
 
+# Recently returned paths are memoized so batch reprints skip even the stat call
+@functools.lru_cache(maxsize=256)
 def generate_barcode(barcode_value):
     try:
         barcode_path = os.path.join("barcodes", barcode_value)
-        logger.info(f"Generating barcode for value: {barcode_value}")
+        full_path = f"{barcode_path}.png"
+        if os.path.exists(full_path):
+            logger.debug("Reusing existing barcode at %s", full_path)
+            return full_path
+        logger.debug("Generating barcode for value: %s", barcode_value)
         barcode = Code128(barcode_value, writer=ImageWriter())
         barcode.save(barcode_path, options={"write_text": False})
-        full_path = f"{barcode_path}.png"
         if os.path.exists(full_path):
-            logger.info(f"Barcode successfully generated at {full_path}")
+            logger.info("Barcode successfully generated at %s", full_path)
             return full_path
         raise FileNotFoundError(f"Barcode file {full_path} not created")
     except Exception as e:
-        logger.error(f"Barcode generation failed for {barcode_value}: {e}\n{traceback.format_exc()}")
+        logger.exception("Barcode generation failed for %s: %s", barcode_value, e)
         raise
 
 def print_receipt(receipt_text, filename):
     try:
-        logger.info(f"Saving receipt to {filename}")
+        logger.debug("Saving receipt to %s", filename)
         with open(filename, "w") as f:
             f.write(receipt_text)
-        logger.info(f"Receipt successfully saved to {filename} (printing not implemented)")
+        logger.info("Receipt successfully saved to %s (printing not implemented)", filename)
         return True
     except Exception as e:
-        logger.error(f"Failed to save receipt to {filename}: {e}\n{traceback.format_exc()}")
+        logger.exception("Failed to save receipt to %s: %s", filename, e)
         return False
 
 def export_to_csv(data, filename, headers):
     try:
-        logger.info(f"Exporting data to CSV: {filename} with headers {headers}")
-        with open(f"exports/{filename}", "w", newline='') as f:
+        logger.debug("Exporting data to CSV: %s with headers %s", filename, headers)
+        # itemgetter returns a bare value for a single key, so wrap that case in a tuple
+        getter = itemgetter(*headers) if len(headers) > 1 else (lambda row: (row[headers[0]],))
+        with open(f"exports/{filename}", "w", newline='', buffering=1 << 20, encoding="utf-8") as f:
             writer = csv.writer(f)
             writer.writerow(headers)
-            for row in data:
-                writer.writerow([row[h] for h in headers])
-        logger.info(f"Data successfully exported to exports/{filename}")
+            writer.writerows(map(getter, data))
+        logger.info("Data successfully exported to exports/%s", filename)
+        return f"exports/{filename}"
+    except Exception as e:
+        logger.exception("Failed to export data to %s: %s", filename, e)
+        raise
+
+def export_sales_to_csv(filename="sales.csv"):
+    # Streams the whole sales table in fetchmany chunks; money columns are formatted by SQLite
+    try:
+        conn = get_read_connection()
+        c = conn.cursor()
+        logger.debug("Exporting sales history to CSV: %s", filename)
+        c.execute(SQL_SALES_EXPORT)
+        rows = 0
+        with open(f"exports/{filename}", "w", newline='', buffering=1 << 20, encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(SALES_EXPORT_HEADERS)
+            while chunk := c.fetchmany(EXPORT_CHUNK_ROWS):
+                writer.writerows(chunk)
+                rows += len(chunk)
+        logger.info("Exported %s sales to exports/%s", rows, filename)
         return f"exports/{filename}"
     except Exception as e:
-        logger.error(f"Failed to export data to {filename}: {e}\n{traceback.format_exc()}")
+        logger.exception("Failed to export sales to %s: %s", filename, e)
         raise
 
 # Main Application
@@ -495,14 +957,31 @@ class ShopifyPOS:
         self.root.geometry("1200x800")
         ctk.set_appearance_mode("light")
         self.root.configure(fg_color="#F5F5F5")
+        self.conn = get_connection()
+        # Cart rows as (product_id, qty, price, name); quantities and prices are also
+        # kept in parallel lists so receipt math runs as one NumPy product
         self.cart = []
+        self.cart_qty = []
+        self.cart_price = []
+        self.pending_sale = None
+        self.pending_export = None
+        self.pending_jobs = {}
+        self.sales_generation = 0
+        self.last_receipt_items = (None, "")
         self.current_staff = None
+        self.history_dialog = None
+        # Sale screen customer picker, loaded once and kept sorted as customers are added
+        customers = get_customers()
+        self.customer_ids = {cust["id"] for cust in customers}
+        self.customer_names = ["None"] + [cust["name"] for cust in customers]
         self.font = ("Arial", 12)
         self.header_font = ("Arial", 16, "bold")
         sns.set_style("whitegrid")
         plt.rcParams['font.family'] = 'Arial'
         plt.rcParams['axes.facecolor'] = '#F5F5F5'
         plt.rcParams['figure.facecolor'] = '#F5F5F5'
+        # Resolve the chart font now so the first dashboard visit skips the font lookup
+        font_manager.findfont(plt.rcParams['font.family'][0])
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.show_login()
 
@@ -517,8 +996,16 @@ class ShopifyPOS:
             if hasattr(self, attr) and getattr(self, attr) is not None:
                 plt.close(getattr(self, attr))
                 setattr(self, attr, None)
+        _io_pool.shutdown(wait=True)
+        close_connection()
         self.root.destroy()
 
+    def new_chart(self, crop_factor=CHART_CROP_FACTOR):
+        width, height = CHART_SIZE
+        # Constrained layout keeps titles and rotated tick labels in view on every draw,
+        # so refreshes don't need a tight_layout() pass
+        return plt.subplots(figsize=(width / crop_factor, height / crop_factor), dpi=CHART_DPI / crop_factor, layout="constrained")
+
     def show_login(self):
         self.clear_frame()
         self.login_frame = ctk.CTkFrame(self.root, fg_color="#FFFFFF", corner_radius=10, border_width=1, border_color="#E0E0E0")
@@ -539,8 +1026,18 @@ class ShopifyPOS:
             messagebox.showwarning("Login Failed", "Invalid PIN.")
 
     def clear_frame(self):
+        # Debounced refreshes belong to the screen being torn down
+        for job in self.pending_jobs.values():
+            self.root.after_cancel(job)
+        self.pending_jobs.clear()
         for widget in self.root.winfo_children():
             widget.destroy()
+        # The customer history dialog is a child of root too, so it goes with the screen
+        self.history_dialog = self.history_table = None
+        # Dashboard figures are reused across refreshes and released only when the dashboard goes away
+        for attr in ['fig_trend', 'fig_products']:
+            if getattr(self, attr, None) is not None:
+                plt.close(getattr(self, attr))
         for attr in ['fig_trend', 'ax_trend', 'canvas_trend', 'fig_products', 'ax_products', 'canvas_products']:
             if hasattr(self, attr):
                 setattr(self, attr, None)
@@ -568,7 +1065,7 @@ class ShopifyPOS:
         self.clear_frame()
         self.dashboard_frame = ctk.CTkFrame(self.root, fg_color="#F5F5F5")
         self.dashboard_frame.pack(fill="both", expand=True, padx=20, pady=20)
-        logger.info("Building Reorganized Modern Dashboard")
+        logger.debug("Building Reorganized Modern Dashboard")
 
         # Grid Configuration
         self.dashboard_frame.grid_rowconfigure(0, weight=0)  # Header
@@ -581,20 +1078,20 @@ class ShopifyPOS:
 
         # Header
         ctk.CTkLabel(self.dashboard_frame, text="Dashboard", font=self.header_font, text_color="#333333").grid(row=0, column=0, columnspan=2, pady=10)
-        logger.info("Header added")
+        logger.debug("Header added")
 
         # Filter Frame
         self.filter_frame = ctk.CTkFrame(self.dashboard_frame, fg_color="#FFFFFF", corner_radius=10, border_width=1, border_color="#E0E0E0")
         self.filter_frame.grid(row=1, column=0, columnspan=2, pady=10, sticky="ew")
         ctk.CTkLabel(self.filter_frame, text="Filter Period:", font=self.font, text_color="#333333").pack(side="left", padx=5)
         self.period_var = tk.StringVar(value="all")
-        period_options = ctk.CTkOptionMenu(self.filter_frame, values=["Today", "Week", "Month", "All Time"], variable=self.period_var, command=self.refresh_dashboard, fg_color="#007BFF", font=self.font)
+        period_options = ctk.CTkOptionMenu(self.filter_frame, values=["Today", "Week", "Month", "All Time"], variable=self.period_var, command=self.schedule_refresh, fg_color="#007BFF", font=self.font)
         period_options.pack(side="left", padx=5)
         ctk.CTkLabel(self.filter_frame, text="Search Product:", font=self.font, text_color="#333333").pack(side="left", padx=5)
         self.search_entry = ctk.CTkEntry(self.filter_frame, placeholder_text="Enter product name", font=self.font, border_color="#E0E0E0")
         self.search_entry.pack(side="left", padx=5, fill="x", expand=True)
-        ctk.CTkButton(self.filter_frame, text="Search", command=self.refresh_dashboard, fg_color="#007BFF", font=self.font).pack(side="left", padx=5)
-        logger.info("Filter frame added")
+        ctk.CTkButton(self.filter_frame, text="Search", command=self.schedule_refresh, fg_color="#007BFF", font=self.font).pack(side="left", padx=5)
+        logger.debug("Filter frame added")
 
         # Middle Row: Sales Overview and Revenue Trend
         middle_frame = ctk.CTkFrame(self.dashboard_frame, fg_color="#F5F5F5")
@@ -609,12 +1106,31 @@ class ShopifyPOS:
         ctk.CTkLabel(self.sales_frame, text="Sales Overview", font=("Arial", 14, "bold"), text_color="#333333").pack(pady=10)
         self.sales_grid = ctk.CTkFrame(self.sales_frame, fg_color="#FFFFFF")
         self.sales_grid.pack(fill="x", padx=15, pady=10)
-        logger.info("Sales Overview frame added")
+        self.sales_labels = [ctk.CTkLabel(self.sales_grid, text="", font=self.font, text_color="#333333") for _ in range(4)]
+        for i, label in enumerate(self.sales_labels):
+            label.grid(row=0, column=i, padx=5, pady=5)
+        logger.debug("Sales Overview frame added")
 
         # Revenue Trend (Right)
         self.trend_frame = ctk.CTkFrame(middle_frame, fg_color="#FFFFFF", corner_radius=10, border_width=1, border_color="#E0E0E0", width=500)
         self.trend_frame.grid(row=0, column=1, padx=15, pady=15, sticky="nsew")
-        logger.info("Revenue Trend frame added")
+        # The trend figure lives as long as the dashboard; refreshes only swap the line data
+        self.fig_trend, self.ax_trend = self.new_chart()
+        self.trend_chart_key = None
+        self.ax_trend.xaxis_date()
+        trend_locator = mdates.AutoDateLocator()
+        self.ax_trend.xaxis.set_major_locator(trend_locator)
+        self.ax_trend.xaxis.set_major_formatter(mdates.ConciseDateFormatter(trend_locator))
+        self.trend_line, = self.ax_trend.plot([], [], color="#007BFF", marker='o', linewidth=2)
+        self.trend_empty_text = self.ax_trend.text(0.5, 0.5, "No Sales Data", ha='center', va='center', fontsize=10, color="#333333", transform=self.ax_trend.transAxes)
+        self.ax_trend.set_title("Revenue Trend", fontsize=12, color="#333333")
+        self.ax_trend.set_xlabel("Date", fontsize=10, color="#333333")
+        self.ax_trend.set_ylabel("Revenue (DZD)", fontsize=10, color="#333333")
+        self.ax_trend.tick_params(axis='x', rotation=45, labelsize=8, colors="#333333")
+        self.ax_trend.tick_params(axis='y', labelsize=8, colors="#333333")
+        self.canvas_trend = FigureCanvasTkAgg(self.fig_trend, master=self.trend_frame)
+        self.canvas_trend.get_tk_widget().pack(fill="both", expand=True, padx=5, pady=5)
+        logger.debug("Revenue Trend frame added")
 
         # Bottom Row: Top Products/Winner and Modern Bar Chart
         bottom_frame = ctk.CTkFrame(self.dashboard_frame, fg_color="#F5F5F5")
@@ -635,52 +1151,69 @@ class ShopifyPOS:
         ctk.CTkLabel(products_card, text="Top Products", font=("Arial", 14, "bold"), text_color="#333333").pack(pady=10, anchor="w", padx=15)
         self.top_products_label = ctk.CTkLabel(products_card, text="", font=("Arial", 12), text_color="#333333", wraplength=450, justify="left")
         self.top_products_label.pack(anchor="w", padx=15, pady=5)
-        ctk.CTkButton(products_card, text="Export", command=lambda: self.export_section(get_top_products(), "top_products.csv", ["name", "total_sold", "total_revenue"]), fg_color="#007BFF", font=self.font).pack(anchor="e", padx=15, pady=5)
+        ctk.CTkButton(products_card, text="Export", command=lambda: self.export_section(get_top_products(limit=None), "top_products.csv", ["name", "total_sold", "total_revenue"]), fg_color="#007BFF", font=self.font).pack(anchor="e", padx=15, pady=5)
 
         winner_card = ctk.CTkFrame(self.left_bottom_frame, fg_color="#FFFFFF")
         winner_card.grid(row=1, column=0, pady=10, sticky="ew")
         ctk.CTkLabel(winner_card, text="Winner Product", font=("Arial", 14, "bold"), text_color="#333333").pack(pady=10, anchor="w", padx=15)
         self.winner_label = ctk.CTkLabel(winner_card, text="Loading...", font=("Arial", 12), text_color="#333333", justify="left")
         self.winner_label.pack(anchor="w", padx=15)
-        logger.info("Top Products and Winner frames added")
+        logger.debug("Top Products and Winner frames added")
 
         # Right: Modern Top Products by Revenue Horizontal Bar Chart
         self.right_bottom_frame = ctk.CTkFrame(bottom_frame, fg_color="#FFFFFF", corner_radius=10, border_width=1, border_color="#E0E0E0", width=500)
         self.right_bottom_frame.grid(row=0, column=1, padx=15, pady=15, sticky="nsew")
         self.right_bottom_frame.grid_columnconfigure(0, weight=1)
         self.right_bottom_frame.grid_rowconfigure(0, weight=1)
-        logger.info("Bottom right frame for Modern Bar chart added")
+        self.fig_products, self.ax_products = self.new_chart()
+        self.products_chart_key = None
+        self.canvas_products = FigureCanvasTkAgg(self.fig_products, master=self.right_bottom_frame)
+        self.canvas_products.get_tk_widget().pack(fill="both", expand=True, padx=5, pady=5)
+        logger.debug("Bottom right frame for Modern Bar chart added")
 
         # Navigation Frame
         self.nav_frame = ctk.CTkFrame(self.dashboard_frame, fg_color="#F5F5F5")
         self.nav_frame.grid(row=4, column=0, columnspan=2, pady=10, sticky="ew")
         ctk.CTkButton(self.nav_frame, text="Back", command=self.show_home, fg_color="#007BFF", font=self.font).pack(side="left", padx=10)
-        ctk.CTkButton(self.nav_frame, text="Refresh", command=self.refresh_dashboard, fg_color="#007BFF", font=self.font).pack(side="left", padx=10)
-        logger.info("Navigation frame added")
+        ctk.CTkButton(self.nav_frame, text="Refresh", command=self.schedule_refresh, fg_color="#007BFF", font=self.font).pack(side="left", padx=10)
+        logger.debug("Navigation frame added")
 
         self.refresh_dashboard()
 
+    def debounce(self, name, delay_ms, callback):
+        # Restart the named timer so a burst of events runs callback once, delay_ms after the last
+        job = self.pending_jobs.pop(name, None)
+        if job is not None:
+            self.root.after_cancel(job)
+        def run():
+            self.pending_jobs.pop(name, None)
+            callback()
+        self.pending_jobs[name] = self.root.after(delay_ms, run)
+
+    def schedule_refresh(self, event=None):
+        # Coalesce bursts of period/search/refresh clicks into one dashboard refresh
+        self.debounce("dashboard", REFRESH_DEBOUNCE_MS, self.refresh_dashboard)
+
     def refresh_dashboard(self, event=None):
         period = self.period_var.get().lower()
         search_term = self.search_entry.get().strip()
 
         # Sales Overview
-        for widget in self.sales_grid.winfo_children():
-            widget.destroy()
         periods = [("Today", "today"), ("Week", "week"), ("Month", "month"), ("All Time", "all")]
+        summary = get_sales_summary_all()
         for i, (label, p) in enumerate(periods):
-            t, q = get_sales_summary(p)
-            a = get_avg_sale_value(p)
-            ctk.CTkLabel(self.sales_grid, text=f"{label}: {t:.2f} DZD\n{q} items\nAvg: {a:.2f} DZD", font=self.font, text_color="#333333").grid(row=0, column=i, padx=5, pady=5)
-        logger.info("Sales Overview refreshed")
+            t, q, a = summary[p]
+            self.sales_labels[i].configure(text=f"{label}: {t:.2f} DZD\n{q} items\nAvg: {a:.2f} DZD")
+        logger.debug("Sales Overview refreshed")
 
         # Top Products
         top_products = get_top_products(limit=5)
         if top_products:
-            self.top_products_label.configure(text="\n".join([f"{p['name']}: {p['total_sold']} sold, {p['total_revenue']:.2f} DZD" for p in top_products]))
+            fields = itemgetter("name", "total_sold", "total_revenue")
+            self.top_products_label.configure(text="\n".join(f"{name}: {sold} sold, {revenue:.2f} DZD" for name, sold, revenue in map(fields, top_products)))
         else:
             self.top_products_label.configure(text="No sales data available.")
-        logger.info("Top Products refreshed")
+        logger.debug("Top Products refreshed")
 
         # Winner Product
         if top_products:
@@ -688,71 +1221,63 @@ class ShopifyPOS:
             self.winner_label.configure(text=f"Top Product: {winner['name']}\nRevenue: {winner['total_revenue']:.2f} DZD\nUnits: {winner['total_sold']}")
         else:
             self.winner_label.configure(text="No sales data available.")
-        logger.info("Winner Product refreshed")
-
-        # Clear previous charts
-        for widget in self.trend_frame.winfo_children():
-            widget.destroy()
-        for widget in self.right_bottom_frame.winfo_children():
-            widget.destroy()
+        logger.debug("Winner Product refreshed")
 
         # Revenue Trend Chart
-        self.fig_trend, self.ax_trend = plt.subplots(figsize=(6, 4))
         trend_days = 30 if period == "month" else 7 if period == "week" else 1 if period == "today" else 365
-        trend_data = get_sales_trend(days=trend_days)
-        if trend_data:
-            self.ax_trend.plot([d["sale_date"] for d in trend_data], [d["daily_total"] for d in trend_data], color="#007BFF", marker='o', linewidth=2)
-            self.ax_trend.set_title("Revenue Trend", fontsize=12, color="#333333")
-            self.ax_trend.set_xlabel("Date", fontsize=10, color="#333333")
-            self.ax_trend.set_ylabel("Revenue (DZD)", fontsize=10, color="#333333")
-            self.ax_trend.tick_params(axis='x', rotation=45, labelsize=8, colors="#333333")
-            self.ax_trend.tick_params(axis='y', labelsize=8, colors="#333333")
-        else:
-            self.ax_trend.text(0.5, 0.5, "No Sales Data", ha='center', va='center', fontsize=10, color="#333333")
-            self.ax_trend.set_title("Revenue Trend", fontsize=12, color="#333333")
-        self.fig_trend.tight_layout()
-        self.canvas_trend = FigureCanvasTkAgg(self.fig_trend, master=self.trend_frame)
-        self.canvas_trend.get_tk_widget().pack(fill="both", expand=True, padx=5, pady=5)
-        self.canvas_trend.draw()
-        self.canvas_trend.get_tk_widget().update()
-        logger.info("Revenue Trend chart refreshed")
+        # A year of daily points is more than the chart can show; plot all-time as weekly totals
+        trend_dates, trend_totals = get_sales_trend(days=trend_days, bucket="week" if trend_days > 30 else "day")
+        # Cached queries often hand back the same series; only repaint when it changed
+        trend_key = (trend_dates.tobytes(), trend_totals.tobytes())
+        if trend_key != self.trend_chart_key:
+            self.trend_chart_key = trend_key
+            self.trend_line.set_data(trend_dates, trend_totals)
+            self.trend_line.set_visible(len(trend_dates) > 0)
+            self.trend_empty_text.set_visible(len(trend_dates) == 0)
+            # An empty axis would otherwise be labelled with 1970 dates
+            self.ax_trend.tick_params(axis='x', labelbottom=len(trend_dates) > 0)
+            self.ax_trend.relim()
+            self.ax_trend.autoscale_view()
+            if len(trend_dates) == 1:
+                # Autoscaling a single date pads it out by years; show the day either side instead.
+                # auto=None keeps x autoscaling on for the next multi-day series.
+                self.ax_trend.set_xlim(trend_dates[0] - 1, trend_dates[0] + 1, auto=None)
+            self.canvas_trend.draw_idle()
+            logger.debug("Revenue Trend chart refreshed")
 
         # Modern Top Products by Revenue Horizontal Bar Chart
-        self.fig_products, self.ax_products = plt.subplots(figsize=(6, 4))
-        if top_products:
-            products = [p["name"] for p in top_products]
-            revenues = [p["total_revenue"] for p in top_products]
+        products_key = tuple(map(tuple, top_products))
+        if products_key != self.products_chart_key:
+            self.products_chart_key = products_key
+            self.ax_products.clear()
+            if top_products:
+                products = [p["name"] for p in top_products]
+                revenues = np.fromiter((p["total_revenue"] for p in top_products), dtype=np.float64, count=len(top_products))
             
-            # Create horizontal bars with a modern gradient
-            bars = self.ax_products.barh(products, revenues, color=plt.cm.Blues(np.linspace(0.2, 0.8, len(products))))
+                # Create horizontal bars with a modern gradient
+                bars = self.ax_products.barh(products, revenues, color=bar_colors(len(products)))
             
-            # Add value labels on the bars
-            for bar in bars:
-                width = bar.get_width()
-                self.ax_products.text(width, bar.get_y() + bar.get_height()/2, f'{width:.2f} DZD', 
-                                   ha='left', va='center', fontweight='bold', fontsize=8, color='white')
+                # Add value labels on the bars
+                self.ax_products.bar_label(bars, labels=[f'{revenue:.2f} DZD' for revenue in revenues],
+                                           padding=3, fontweight='bold', fontsize=8, color='white')
             
-            # Customize the chart for a modern look
-            self.ax_products.set_title("Top Products by Revenue", fontsize=12, color="#333333", pad=15)
-            self.ax_products.set_xlabel("Revenue (DZD)", fontsize=10, color="#333333")
-            self.ax_products.set_ylabel("Product", fontsize=10, color="#333333")
-            self.ax_products.tick_params(axis='x', labelsize=8, colors="#333333")
-            self.ax_products.tick_params(axis='y', labelsize=8, colors="#333333")
-            self.ax_products.spines['top'].set_visible(False)
-            self.ax_products.spines['right'].set_visible(False)
-            self.ax_products.spines['left'].set_color('#333333')
-            self.ax_products.spines['bottom'].set_color('#333333')
-            self.ax_products.set_facecolor('#F5F5F5')
-            self.ax_products.grid(axis='x', linestyle='--', alpha=0.7, color='#999999')
-        else:
-            self.ax_products.text(0.5, 0.5, "No Sales Data", ha='center', va='center', fontsize=10, color="#333333")
-            self.ax_products.set_title("Top Products by Revenue", fontsize=12, color="#333333")
-        self.fig_products.tight_layout()
-        self.canvas_products = FigureCanvasTkAgg(self.fig_products, master=self.right_bottom_frame)
-        self.canvas_products.get_tk_widget().pack(fill="both", expand=True, padx=5, pady=5)
-        self.canvas_products.draw()
-        self.canvas_products.get_tk_widget().update()
-        logger.info("Modern Top Products Bar chart refreshed")
+                # Customize the chart for a modern look
+                self.ax_products.set_title("Top Products by Revenue", fontsize=12, color="#333333", pad=15)
+                self.ax_products.set_xlabel("Revenue (DZD)", fontsize=10, color="#333333")
+                self.ax_products.set_ylabel("Product", fontsize=10, color="#333333")
+                self.ax_products.tick_params(axis='x', labelsize=8, colors="#333333")
+                self.ax_products.tick_params(axis='y', labelsize=8, colors="#333333")
+                self.ax_products.spines['top'].set_visible(False)
+                self.ax_products.spines['right'].set_visible(False)
+                self.ax_products.spines['left'].set_color('#333333')
+                self.ax_products.spines['bottom'].set_color('#333333')
+                self.ax_products.set_facecolor('#F5F5F5')
+                self.ax_products.grid(axis='x', linestyle='--', alpha=0.7, color='#999999')
+            else:
+                self.ax_products.text(0.5, 0.5, "No Sales Data", ha='center', va='center', fontsize=10, color="#333333")
+                self.ax_products.set_title("Top Products by Revenue", fontsize=12, color="#333333")
+            self.canvas_products.draw_idle()
+            logger.debug("Modern Top Products Bar chart refreshed")
 
         logger.info("Dashboard refreshed with period: %s, search: %s", period, search_term)
 
@@ -781,6 +1306,7 @@ class ShopifyPOS:
         for col in ("ID", "Name", "Price", "Stock", "Category", "Barcode"):
             self.inv_table.heading(col, text=col)
             self.inv_table.column(col, width=100)
+        self.inv_table.configure(yscrollcommand=self.load_more_on_scroll(self.load_inventory_page))
         self.inv_table.pack(fill="both", expand=True, pady=10)
         self.inv_low_stock = ctk.CTkLabel(self.inventory_frame, text="Low Stock Alerts: None", font=self.font, text_color="#333333")
         self.inv_low_stock.pack(pady=5)
@@ -804,7 +1330,7 @@ class ShopifyPOS:
         sale_frame.grid(row=1, column=0, pady=10, sticky="ew")
         self.sale_product_id = ctk.CTkEntry(sale_frame, placeholder_text="Product ID", font=self.font, border_color="#E0E0E0")
         self.sale_quantity = ctk.CTkEntry(sale_frame, placeholder_text="Quantity", font=self.font, border_color="#E0E0E0")
-        self.sale_customer = ctk.CTkComboBox(sale_frame, values=["None"] + [c["name"] for c in get_customers()], font=self.font)
+        self.sale_customer = ctk.CTkComboBox(sale_frame, values=self.customer_names, font=self.font)
         self.sale_payment = ctk.CTkComboBox(sale_frame, values=["Cash", "Card"], font=self.font)
         self.sale_discount = ctk.CTkEntry(sale_frame, placeholder_text="Discount (DZD)", font=self.font, border_color="#E0E0E0")
         for i, widget in enumerate([self.sale_product_id, self.sale_quantity, self.sale_customer, self.sale_payment, self.sale_discount]):
@@ -821,17 +1347,21 @@ class ShopifyPOS:
         history_frame.grid(row=3, column=0, pady=10, sticky="ew")
         self.sales_search = ctk.CTkEntry(history_frame, placeholder_text="Search by ID/Date", font=self.font, border_color="#E0E0E0")
         self.sales_search.pack(side="left", padx=10, pady=5, fill="x", expand=True)
+        self.sales_search.bind("<KeyRelease>", lambda event: self.debounce("sales_search", SEARCH_DEBOUNCE_MS, self.refresh_sales))
         ctk.CTkButton(history_frame, text="Search", command=self.refresh_sales, fg_color="#007BFF", font=self.font).pack(side="right", padx=10, pady=5)
         self.sales_table = ttk.Treeview(self.sales_frame, columns=("ID", "Product ID", "Quantity", "Total", "Discount", "Date", "Staff", "Payment", "Customer"), show="headings")
         for col in ("ID", "Product ID", "Quantity", "Total", "Discount", "Date", "Staff", "Payment", "Customer"):
             self.sales_table.heading(col, text=col)
             self.sales_table.column(col, width=100)
+        self.sales_table.configure(yscrollcommand=self.load_more_on_scroll(self.load_sales_page))
+        self.sales_rows = {}
         self.sales_table.grid(row=4, column=0, pady=10, sticky="nsew")
         button_frame = ctk.CTkFrame(self.sales_frame, fg_color="#F5F5F5")
         button_frame.grid(row=5, column=0, pady=10, sticky="s")
         ctk.CTkButton(button_frame, text="Clear Cart", command=self.clear_cart, fg_color="#007BFF", font=self.font).pack(side="left", padx=5)
         ctk.CTkButton(button_frame, text="Remove Item", command=self.remove_cart_item, fg_color="#007BFF", font=self.font).pack(side="left", padx=5)
         ctk.CTkButton(button_frame, text="Process Return", command=self.process_return, fg_color="#007BFF", font=self.font).pack(side="left", padx=5)
+        ctk.CTkButton(button_frame, text="Export Sales", command=self.export_sales, fg_color="#007BFF", font=self.font).pack(side="left", padx=5)
         ctk.CTkButton(button_frame, text="Back", command=self.show_home, fg_color="#007BFF", font=self.font).pack(side="left", padx=5)
         self.refresh_sales()
 
@@ -853,12 +1383,16 @@ class ShopifyPOS:
         search_frame.pack(fill="x", pady=10)
         self.cust_search = ctk.CTkEntry(search_frame, placeholder_text="Search by Name/Email", font=self.font, border_color="#E0E0E0")
         self.cust_search.pack(side="left", padx=10, pady=5, fill="x", expand=True)
+        self.cust_search.bind("<KeyRelease>", lambda event: self.debounce("cust_search", SEARCH_DEBOUNCE_MS, self.refresh_customers))
         ctk.CTkButton(search_frame, text="Search", command=self.refresh_customers, fg_color="#007BFF", font=self.font).pack(side="right", padx=10, pady=5)
+        self.cust_contains = tk.BooleanVar(value=False)
+        ctk.CTkCheckBox(search_frame, text="Contains", variable=self.cust_contains, command=self.refresh_customers, font=self.font).pack(side="right", padx=5, pady=5)
         self.cust_table = ttk.Treeview(self.customers_frame, columns=("Name", "Email", "Points"), show="headings")
         for col in ("Name", "Email", "Points"):
             self.cust_table.heading(col, text=col)
             self.cust_table.column(col, width=200)
         self.cust_table.pack(fill="both", expand=True, pady=10)
+        self.cust_rows = {}
         self.cust_table.bind("<Double-1>", self.show_customer_history)
         ctk.CTkButton(self.customers_frame, text="Back", command=self.show_home, fg_color="#007BFF", font=self.font).pack(pady=10)
         self.refresh_customers()
@@ -934,45 +1468,80 @@ class ShopifyPOS:
         except ValueError as e:
             messagebox.showwarning("Error", str(e))
 
-    def refresh_inventory(self):
-        for item in self.inv_table.get_children():
-            self.inv_table.delete(item)
-        products = get_inventory(self.inv_search.get())
+    def load_more_on_scroll(self, load_page):
+        # Treeview yscrollcommand: fetch the next page once the bottom of the table is in view
+        def on_scroll(first, last):
+            if float(last) >= 1.0:
+                load_page()
+        return on_scroll
+
+    def load_inventory_page(self):
+        if not self.inv_has_more:
+            return
+        products = get_inventory(self.inv_term, offset=self.inv_offset)
+        self.inv_offset += len(products)
+        self.inv_has_more = len(products) == PAGE_SIZE
         for p in products:
             self.inv_table.insert("", "end", values=(p["id"], p["name"], f"{p['price']:.2f}", p["stock"], p["category"], p["barcode"]))
+
+    def refresh_inventory(self):
+        self.inv_table.delete(*self.inv_table.get_children())
+        # Later pages come from the term that was searched, not whatever is typed since
+        self.inv_term = self.inv_search.get()
+        self.inv_offset, self.inv_has_more = 0, True
+        self.load_inventory_page()
         low_stock = get_low_stock()
         self.inv_low_stock.configure(text=f"Low Stock Alerts: {', '.join([p['name'] for p in low_stock]) or 'None'}")
 
+    def sale_in_progress(self):
+        # The cart is what gets emptied once the background sale finishes, so it stays
+        # read-only until then
+        if self.pending_sale is not None:
+            messagebox.showwarning("Error", "The previous sale is still being processed.")
+            return True
+        return False
+
     def add_to_cart(self):
+        if self.sale_in_progress():
+            return
         try:
             product_id = int(self.sale_product_id.get())
             qty = int(self.sale_quantity.get())
             if qty <= 0:
                 raise ValueError("Quantity must be positive.")
-            with sqlite3.connect("shopify_pos.db") as conn:
-                c = conn.cursor()
-                c.execute("SELECT price, stock, name FROM products WHERE id = ?", (product_id,))
-                result = c.fetchone()
-                if not result or result[1] < qty:
-                    raise ValueError("Not enough stock or invalid ID.")
-                price, _, name = result
-                self.cart.append((product_id, qty, price, name))
-                logger.info(f"Added to cart: Product ID {product_id}, Quantity {qty}, Name {name}, Price {price}")
-                self.update_cart_display()
+            c = self.conn.cursor()
+            c.execute(SQL_CART_PRODUCT, (product_id,))
+            result = c.fetchone()
+            if not result or result[1] < qty:
+                raise ValueError("Not enough stock or invalid ID.")
+            price, _, name = result
+            self.cart.append((product_id, qty, price, name))
+            self.cart_qty.append(qty)
+            self.cart_price.append(price)
+            logger.debug("Added to cart: Product ID %s, Quantity %s, Name %s, Price %s", product_id, qty, name, price)
+            self.update_cart_display()
             self.sale_product_id.delete(0, tk.END)
             self.sale_quantity.delete(0, tk.END)
             self.sale_product_id.focus()
         except ValueError as e:
             messagebox.showwarning("Error", str(e))
 
+    def cart_subtotals(self):
+        return np.asarray(self.cart_qty, dtype=np.int64) * np.asarray(self.cart_price, dtype=np.float64)
+
+    def empty_cart(self):
+        self.cart.clear()
+        self.cart_qty.clear()
+        self.cart_price.clear()
+
     def update_cart_display(self):
-        for item in self.cart_table.get_children():
-            self.cart_table.delete(item)
-        for product_id, qty, price, name in self.cart:
-            subtotal = price * qty
+        self.cart_table.delete(*self.cart_table.get_children())
+        for (product_id, qty, _, name), subtotal in zip(self.cart, self.cart_subtotals()):
             self.cart_table.insert("", "end", values=(product_id, name, qty, f"{subtotal:.2f}"))
 
     def remove_cart_item(self):
+        if self.sale_in_progress():
+            return
         selected = self.cart_table.selection()
         if not selected:
             messagebox.showwarning("Error", "Select an item.")
@@ -981,7 +1550,9 @@ class ShopifyPOS:
         name = self.cart_table.item(selected[0], "values")[1]
         if messagebox.askyesno("Confirm", f"Remove {name} from cart?"):
             del self.cart[index]
-            logger.info(f"Removed item from cart: {name}")
+            del self.cart_qty[index]
+            del self.cart_price[index]
+            logger.info("Removed item from cart: %s", name)
             self.update_cart_display()
 
     def preview_receipt(self):
@@ -990,21 +1561,11 @@ class ShopifyPOS:
             return
         discount = float(self.sale_discount.get() or 0)
         customer_name = self.sale_customer.get()
-        receipt_lines = ["Shopify POS Receipt"]
-        total = 0
-        for _, qty, price, name in self.cart:
-            subtotal = price * qty
-            total += subtotal
-            receipt_lines.append(f"Item: {name}")
-            receipt_lines.append(f"Quantity: {qty}")
-            receipt_lines.append(f"Subtotal: {subtotal:.2f} DZD")
-        receipt_lines.append(f"Discount: {discount:.2f} DZD")
-        receipt_lines.append(f"Total: {total - discount:.2f} DZD")
-        receipt_lines.append(f"Payment Method: {self.sale_payment.get()}")
-        receipt_lines.append(f"Customer: {customer_name if customer_name != 'None' else 'N/A'}")
-        receipt_lines.append(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        receipt_lines.append(f"Staff: {self.current_staff['name']}")
-        receipt = "\n".join(receipt_lines)
+        payment_method = self.sale_payment.get()
+        subtotals = self.cart_subtotals()
+        total = float(subtotals.sum())
+        receipt = self.build_receipt(self.receipt_items(subtotals), discount, total - discount, payment_method,
+                                     customer_name, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.current_staff['name'])
         dialog = ctk.CTkToplevel(self.root)
         dialog.title("Receipt Preview")
         dialog.configure(fg_color="#F5F5F5")
@@ -1018,44 +1579,78 @@ class ShopifyPOS:
         if not self.cart:
             messagebox.showwarning("Error", "Cart is empty!")
             return
+        if self.sale_in_progress():
+            return
         discount = float(self.sale_discount.get() or 0)
         customer_name = self.sale_customer.get()
+        payment_method = self.sale_payment.get()
         customer_id = None
         if customer_name != "None":
-            with sqlite3.connect("shopify_pos.db") as conn:
-                c = conn.cursor()
-                c.execute("SELECT id FROM customers WHERE name = ?", (customer_name,))
-                result = c.fetchone()
-                customer_id = result[0] if result else None
-                logger.info(f"Selected customer for sale: {customer_name}, ID {customer_id}")
-        total, sale_date = record_sale([(pid, qty, price) for pid, qty, price, _ in self.cart], self.current_staff["id"], self.sale_payment.get(), discount, customer_id)
-        if total:
-            receipt_lines = ["Shopify POS Receipt"]
-            for _, qty, price, name in self.cart:
-                subtotal = price * qty
-                receipt_lines.append(f"Item: {name}")
-                receipt_lines.append(f"Quantity: {qty}")
-                receipt_lines.append(f"Subtotal: {subtotal:.2f} DZD")
-            receipt_lines.append(f"Discount: {discount:.2f} DZD")
-            receipt_lines.append(f"Total: {total:.2f} DZD")
-            receipt_lines.append(f"Payment Method: {self.sale_payment.get()}")
-            receipt_lines.append(f"Customer: {customer_name if customer_name != 'None' else 'N/A'}")
-            receipt_lines.append(f"Date: {sale_date}")
-            receipt_lines.append(f"Staff: {self.current_staff['name']}")
-            receipt = "\n".join(receipt_lines)
-            receipt_filename = f"receipts/receipt_{sale_date.replace(':', '-')}.txt"
-            print_status = "Printed" if print_receipt(receipt, receipt_filename) else "Saved"
-            messagebox.showinfo("Sale Processed", f"{receipt}\n{print_status} to {receipt_filename}")
-            self.cart.clear()
+            c = self.conn.cursor()
+            c.execute(SQL_CUSTOMER_ID_BY_NAME, (customer_name,))
+            result = c.fetchone()
+            customer_id = result[0] if result else None
+            logger.debug("Selected customer for sale: %s, ID %s", customer_name, customer_id)
+        # Recording the sale and writing the receipt run on the I/O pool
+        self.pending_sale = self.run_in_background(self.complete_sale, list(self.cart), self.receipt_items(self.cart_subtotals()),
+                                                   dict(self.current_staff), payment_method, discount, customer_id, customer_name,
+                                                   on_done=self.on_sale_completed)
+
+    def receipt_items(self, subtotals):
+        # Item lines depend only on the cart, so preview followed by finalize formats them once
+        key = tuple(self.cart)
+        if self.last_receipt_items[0] != key:
+            self.last_receipt_items = (key, "\n".join(f"Item: {name}\nQuantity: {qty}\nSubtotal: {subtotal:.2f} DZD"
+                                                       for (_, qty, _, name), subtotal in zip(self.cart, subtotals)))
+        return self.last_receipt_items[1]
+
+    @staticmethod
+    def build_receipt(items, discount, total, payment_method, customer_name, date, staff_name):
+        return "\n".join([
+            "Shopify POS Receipt",
+            items,
+            f"Discount: {discount:.2f} DZD",
+            f"Total: {total:.2f} DZD",
+            f"Payment Method: {payment_method}",
+            f"Customer: {customer_name if customer_name != 'None' else 'N/A'}",
+            f"Date: {date}",
+            f"Staff: {staff_name}",
+        ])
+
+    @staticmethod
+    def complete_sale(cart, items, staff, payment_method, discount, customer_id, customer_name):
+        total, sale_date, sale_id = record_sale([(pid, qty, price) for pid, qty, price, _ in cart], staff["id"], payment_method, discount, customer_id)
+        if sale_id is None:
+            return None
+        receipt = ShopifyPOS.build_receipt(items, discount, total, payment_method, customer_name, sale_date, staff["name"])
+        receipt_filename = f"receipts/receipt_{sale_id}.txt"
+        print_status = "Printed" if print_receipt(receipt, receipt_filename) else "Saved"
+        return receipt, receipt_filename, print_status
+
+    def on_sale_completed(self, future):
+        self.pending_sale = None
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.exception("Sale processing failed: %s", e)
+            result = None
+        if result is None:
+            messagebox.showwarning("Error", "Sale failed.")
+            return
+        receipt, receipt_filename, print_status = result
+        messagebox.showinfo("Sale Processed", f"{receipt}\n{print_status} to {receipt_filename}")
+        self.empty_cart()
+        # The user may have left the sales screen while the sale was recorded
+        if self.cart_table.winfo_exists():
             self.update_cart_display()
             self.sale_discount.delete(0, tk.END)
             self.sale_customer.set("None")
             self.refresh_sales()
-        else:
-            messagebox.showwarning("Error", "Sale failed.")
 
     def clear_cart(self):
-        self.cart.clear()
+        if self.sale_in_progress():
+            return
+        self.empty_cart()
         self.update_cart_display()
         self.sale_discount.delete(0, tk.END)
         self.sale_customer.set("None")
@@ -1071,37 +1666,103 @@ class ShopifyPOS:
         qty = int(self.sales_table.item(selected[0], "values")[2])
         total = float(self.sales_table.item(selected[0], "values")[3].replace(" DZD", ""))
         if messagebox.askyesno("Confirm", f"Return {qty} items for {total:.2f} DZD?"):
-            with sqlite3.connect("shopify_pos.db") as conn:
+            with transaction() as conn:
                 c = conn.cursor()
-                logger.info(f"Processing return: Sale ID {sale_id}, Product ID {product_id}, Quantity {qty}, Total {total}")
-                c.execute("DELETE FROM sales WHERE id = ?", (sale_id,))
-                c.execute("UPDATE products SET stock = stock + ? WHERE id = ?", (qty, product_id))
-                conn.commit()
-                logger.info(f"Return processed successfully for Sale ID {sale_id}")
+                logger.debug("Processing return: Sale ID %s, Product ID %s, Quantity %s, Total %s", sale_id, product_id, qty, total)
+                c.execute(SQL_SALE_DELETE, (sale_id,))
+                c.execute(SQL_STOCK_RESTORE, (qty, product_id))
+            logger.info("Return processed successfully for Sale ID %s", sale_id)
             messagebox.showinfo("Success", "Return processed.")
-            self.refresh_sales()
+            self.sales_table.delete(selected[0])
+            self.sales_rows.pop(selected[0], None)
+
+    def run_in_background(self, func, *args, on_done):
+        # Run func on the I/O pool and poll from the Tk loop; on_done gets the finished
+        # future on the main thread, since Tk widgets must not be touched from workers
+        future = _io_pool.submit(func, *args)
+        def poll():
+            if future.done():
+                on_done(future)
+            else:
+                self.root.after(BACKGROUND_POLL_MS, poll)
+        self.root.after(BACKGROUND_POLL_MS, poll)
+        return future
+
+    def sync_table(self, table, rendered, rows):
+        # Bring a Treeview in line with rows, a list of (iid, values) in display order,
+        # touching only rows that were added, removed or changed. rendered maps iid to the
+        # values currently shown; both lists share one sort order, so rows that survive
+        # keep their relative positions and new ones are inserted in place.
+        wanted = dict(rows)
+        stale = [iid for iid in rendered if iid not in wanted]
+        if stale:
+            table.delete(*stale)
+        for index, (iid, values) in enumerate(rows):
+            shown = rendered.get(iid)
+            if shown is None:
+                table.insert("", index, iid=iid, values=values)
+            elif shown != values:
+                table.item(iid, values=values)
+        return wanted
+
+    @staticmethod
+    def sale_row(sale):
+        return str(sale["id"]), tuple(sale)
 
     def refresh_sales(self):
-        for item in self.sales_table.get_children():
-            self.sales_table.delete(item)
-        sales = get_sales_history(self.sales_search.get())
-        with sqlite3.connect("shopify_pos.db") as conn:
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            for sale in sales:
-                c.execute("SELECT name FROM staff WHERE id = ?", (sale["staff_id"],))
-                staff_result = c.fetchone()
-                staff_name = staff_result["name"] if staff_result else "N/A"
-                customer_name = "N/A"
-                if sale["customer_id"]:
-                    c.execute("SELECT name FROM customers WHERE id = ?", (sale["customer_id"],))
-                    customer_result = c.fetchone()
-                    customer_name = customer_result["name"] if customer_result else "N/A"
-                self.sales_table.insert("", "end", values=(sale["id"], sale["product_id"], sale["quantity"], f"{sale['total']:.2f}", 
-                                                           f"{sale['discount']:.2f}", sale["date"], staff_name, sale["payment_method"], customer_name))
+        # A new generation makes any page still loading for the previous search stale
+        self.sales_generation += 1
+        self.sales_term = self.sales_search.get()
+        self.sales_last_id, self.sales_has_more, self.sales_loading = None, True, False
+        self.load_sales_page()
+
+    def load_sales_page(self):
+        if not self.sales_has_more or self.sales_loading:
+            return
+        self.sales_loading = True
+        generation = self.sales_generation
+        self.run_in_background(get_sales_history, self.sales_term, PAGE_SIZE, self.sales_last_id,
+                               on_done=lambda future: self.show_sales_page(future, generation))
+
+    def show_sales_page(self, future, generation):
+        # Drop pages for an older search or a sales screen that has since been left
+        if generation != self.sales_generation or not self.sales_table.winfo_exists():
+            return
+        self.sales_loading = False
+        try:
+            sales = future.result()
+        except Exception as e:
+            logger.exception("Failed to load sales history: %s", e)
+            self.sales_has_more = False
+            return
+        first_page = self.sales_last_id is None
+        if sales:
+            self.sales_last_id = sales[-1]["id"]
+        self.sales_has_more = len(sales) == PAGE_SIZE
+        rows = [self.sale_row(sale) for sale in sales]
+        if first_page:
+            # Reconcile with what is on screen so a refresh only touches rows that changed
+            self.sales_rows = self.sync_table(self.sales_table, self.sales_rows, rows)
+            return
+        for iid, values in rows:
+            self.sales_table.insert("", "end", iid=iid, values=values)
+            self.sales_rows[iid] = values
 
     def export_sales(self):
-        filename = export_sales_to_csv()
+        # Both pool workers could otherwise write exports/sales.csv at once
+        if self.pending_export is not None:
+            messagebox.showwarning("Error", "The sales export is still running.")
+            return
+        self.pending_export = self.run_in_background(export_sales_to_csv, on_done=self.on_sales_exported)
+
+    def on_sales_exported(self, future):
+        self.pending_export = None
+        try:
+            filename = future.result()
+        except Exception:
+            # export_sales_to_csv has already logged the failure
+            messagebox.showwarning("Error", "Sales export failed.")
+            return
         messagebox.showinfo("Success", f"Sales exported to {filename}")
 
     def export_section(self, data, filename, headers):
@@ -1116,64 +1777,65 @@ class ShopifyPOS:
             age = int(self.cust_age.get() or 0) if self.cust_age.get() else None
             if not name:
                 raise ValueError("Name cannot be empty.")
-            add_customer(name, email, points, age)
+            customer_id = add_customer(name, email, points, age)
+            # An existing email returns the stored customer, leaving the table as it is
+            is_new = customer_id not in self.customer_ids
+            if is_new:
+                self.customer_ids.add(customer_id)
+                bisect.insort(self.customer_names, name, lo=1)
             messagebox.showinfo("Success", f"Added {name}")
             self.cust_name.delete(0, tk.END)
             self.cust_email.delete(0, tk.END)
             self.cust_points.delete(0, tk.END)
             self.cust_age.delete(0, tk.END)
-            self.refresh_customers()
-            if hasattr(self, 'sale_customer'):
-                self.sale_customer.configure(values=["None"] + [c["name"] for c in get_customers()])
+            if is_new and not self.cust_search.get():
+                # Rows are ordered by id, so the unfiltered list just gains one row at the end
+                iid = str(customer_id)
+                self.cust_rows[iid] = (name, email, points)
+                self.cust_table.insert("", "end", iid=iid, values=self.cust_rows[iid])
+            elif is_new:
+                self.refresh_customers()
         except ValueError as e:
             messagebox.showwarning("Error", str(e))
 
     def refresh_customers(self):
-        for item in self.cust_table.get_children():
-            self.cust_table.delete(item)
-        with sqlite3.connect("shopify_pos.db") as conn:
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            search = self.cust_search.get()
-            if search:
-                c.execute("SELECT name, email, points FROM customers WHERE name LIKE ? OR email LIKE ?", (f"%{search}%", f"%{search}%"))
-            else:
-                c.execute("SELECT name, email, points FROM customers")
-            for cust in c.fetchall():
-                self.cust_table.insert("", "end", values=(cust["name"], cust["email"], cust["points"]))
+        rows = [(str(cust["id"]), (cust["name"], cust["email"], cust["points"]))
+                for cust in search_customers(self.cust_search.get(), contains=self.cust_contains.get())]
+        self.cust_rows = self.sync_table(self.cust_table, self.cust_rows, rows)
 
     def show_customer_history(self, event):
         selected = self.cust_table.selection()
         if not selected:
             return
-        email = self.cust_table.item(selected[0], "values")[1]
-        with sqlite3.connect("shopify_pos.db") as conn:
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            c.execute("SELECT id FROM customers WHERE email = ?", (email,))
-            customer_id = c.fetchone()["id"]
-            history = get_customer_history(customer_id)
+        # refresh_customers keys the rows by customer id
+        history = get_customer_history(int(selected[0]))
+        if self.history_dialog is None:
+            self.build_history_dialog()
+        table = self.history_table
+        table.delete(*table.get_children())
+        for sale in history:
+            table.insert("", "end", values=tuple(sale))
+        self.history_dialog.title(f"History for {self.cust_table.item(selected[0], 'values')[0]}")
+        self.history_dialog.deiconify()
+        self.history_dialog.lift()
+
+    def build_history_dialog(self):
+        # Built on first use and hidden on close, so later opens only swap the rows
         dialog = ctk.CTkToplevel(self.root)
-        dialog.title(f"History for {self.cust_table.item(selected[0], 'values')[0]}")
         dialog.configure(fg_color="#F5F5F5")
+        dialog.protocol("WM_DELETE_WINDOW", dialog.withdraw)
         table = ttk.Treeview(dialog, columns=("ID", "Product ID", "Quantity", "Total", "Discount", "Date"), show="headings")
         for col in ("ID", "Product ID", "Quantity", "Total", "Discount", "Date"):
             table.heading(col, text=col)
             table.column(col, width=100)
-        for sale in history:
-            table.insert("", "end", values=(sale["id"], sale["product_id"], sale["quantity"], f"{sale['total']:.2f}", f"{sale['discount']:.2f}", sale["date"]))
         table.pack(fill="both", expand=True, padx=10, pady=10)
-        ctk.CTkButton(dialog, text="Close", command=dialog.destroy, fg_color="#007BFF", font=self.font).pack(pady=5)
+        ctk.CTkButton(dialog, text="Close", command=dialog.withdraw, fg_color="#007BFF", font=self.font).pack(pady=5)
+        self.history_dialog = dialog
+        self.history_table = table
 
 if __name__ == "__main__":
     setup_database()
-    with sqlite3.connect("shopify_pos.db") as conn:
-        c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO staff (id, name, pin, role) VALUES (1, 'Admin', '1234', 'admin')")
-       # c.execute("INSERT OR IGNORE INTO products (id, name, price, stock, category, barcode) VALUES (1, 'Pen', 5.0, 10, 'Stationery', 'Pen_5_Initial')")
-       # c.execute("INSERT OR IGNORE INTO sales (product_id, quantity, total, discount, date, staff_id, payment_method) VALUES (1, 2, 10.0, 0, ?, 1, 'Cash')", (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
-        conn.commit()
-        logger.info("Test data inserted: Pen, 2 sold, 10 DZD")
+    bootstrap_admin()
     root = ctk.CTk()
     app = ShopifyPOS(root)
     root.mainloop()
\ No newline at end of file